@@ -1,30 +1,304 @@
+import json
+import os
+import time
+
 from data.data_loader import DataLoader
+from data.state import load_state, save_state
 from analyzers.country_analyzer import CountryAnalyzer
 from analyzers.browser_analyzer import BrowserAnalyzer
 from analyzers.reader_analyzer import ReaderAnalyzer
 from analyzers.recommendation import RecommendationAnalyzer
+from analyzers.also_likes_table import AlsoLikesTable, load_table, save_table
+from analyzers.rollup_analyzer import RollupAnalyzer
+from analyzers.sketch_analyzer import SketchAnalyzer
 from visualization.graph_visualizer import GraphVisualizer
 
+# Analyzers each CLI task needs, used to skip indices and columns nobody reads
+TASK_ANALYZERS = {
+    '2a': ['country'], '2b': ['country'],
+    '3a': ['browser'], '3b': ['browser'],
+    '4': ['reader'],
+    '5d': ['recommendation'], '6': ['recommendation'], '7': ['recommendation'],
+}
+
 class AnalyticsManager:
-    def __init__(self, file_path=None):
+    def __init__(self, file_path=None, load=True):
         self.data_loader = DataLoader(file_path)
-        self.data = self.data_loader.load_data()
-        
+        self.graph_visualizer = GraphVisualizer()
+        # Precomputed top-K also-likes of the current file, see build_also_likes_table
+        self.also_likes_table = None
+        # Hourly/daily rollup cubes, only maintained when ingest is asked to
+        self.rollup_analyzer = None
+        # Fixed-memory approximate counts, only maintained when ingest is asked to
+        self.sketch_analyzer = None
+        if load:
+            self.ingest()
+    
+    def _create_analyzers(self):
         # Initialize analyzers for tasks 1-4
-        self.country_analyzer = CountryAnalyzer(self.data)
-        self.browser_analyzer = BrowserAnalyzer(self.data)
-        self.reader_analyzer = ReaderAnalyzer(self.data)
+        self.country_analyzer = CountryAnalyzer()
+        self.browser_analyzer = BrowserAnalyzer()
+        self.reader_analyzer = ReaderAnalyzer()
         
         # Initialize analyzers for tasks 5-8
-        self.recommendation_analyzer = RecommendationAnalyzer(self.data_loader)
-        self.graph_visualizer = GraphVisualizer()
+        self.recommendation_analyzer = RecommendationAnalyzer()
+    
+    def _consumers(self):
+        return {
+            'country': self.country_analyzer,
+            'browser': self.browser_analyzer,
+            'reader': self.reader_analyzer,
+            'recommendation': self.recommendation_analyzer,
+        }
+    
+    def ingest(self, file_path=None, tasks=None, incremental=False, window=None, rollups=False,
+               sketches=False):
+        """Parse the data file once and feed every record to the analyzers
+
+        With a list of task ids only the analyzers those tasks use are built,
+        and only the columns they read are extracted from each record. In
+        incremental mode every analyzer resumes from the state saved by the
+        previous run and only consumes the events appended since. A
+        (start, end) window limits every analysis to start <= ts < end. With
+        rollups the hourly and daily cubes of rollup_analyzer are built too,
+        with sketches the approximate counts of sketch_analyzer.
+        """
+        if file_path:
+            self.data_loader.file_path = file_path
+        if incremental:
+            if window is not None:
+                raise ValueError("Time windows cannot be combined with incremental ingest")
+            self.ingest_incremental()
+            return
+        
+        self._create_analyzers()
+        consumers = self._consumers()
+        if tasks is not None:
+            consumers = {name: consumers[name] for task in tasks for name in TASK_ANALYZERS[task]}
+        self.rollup_analyzer = None
+        if rollups:
+            # Share the browser classification when the browser analyzer runs anyway
+            self.rollup_analyzer = RollupAnalyzer(browser_analyzer=consumers.get('browser'))
+            consumers['rollup'] = self.rollup_analyzer
+        self.sketch_analyzer = None
+        if sketches:
+            self.sketch_analyzer = SketchAnalyzer()
+            consumers['sketch'] = self.sketch_analyzer
+        self.data_loader.columns = None
+        self.data_loader.event_types = None
+        self.data_loader.window = window
+        if tasks is not None:
+            self.data_loader.columns = sorted({column for consumer in consumers.values()
+                                               for column in consumer.COLUMNS}
+                                              | ({'ts'} if window is not None else set()))
+            # Events no selected analyzer reads are skipped before decoding
+            if consumers and all(consumer.EVENT_TYPES is not None for consumer in consumers.values()):
+                self.data_loader.event_types = sorted({event_type for consumer in consumers.values()
+                                                       for event_type in consumer.EVENT_TYPES})
+        consumers = list(consumers.values())
+        
+        # Records are encoded into columnar chunks as they are streamed (or
+        # read back from the file's snapshot), so memory is bounded by the
+        # chunk size and the indices rather than the size of the file. All
+        # chunks share one set of string tables.
+        self.tables = None
+        for chunk in self.data_loader.iter_chunks():
+            self.tables = chunk.tables
+            for consumer in consumers:
+                consumer.consume(chunk)
+        # The precomputed rankings cover the whole file, not a window of it
+        if window is None:
+            self._load_also_likes_table()
+        else:
+            self.also_likes_table = None
+    
+    def ingest_incremental(self):
+        """Bring every analyzer up to date with the file, consuming only its new tail
+
+        The analyzers, string tables and byte offset are saved after each run
+        (unless caching is off), so the cost of a refresh is proportional to
+        the events appended since the previous one. A file that was rewritten
+        rather than appended to is consumed from the start.
+        """
+        loader = self.data_loader
+        loader.columns = None
+        loader.event_types = None
+        loader.window = None
+        restored = load_state(loader.file_path, loader.cache_dir) if loader.use_cache else None
+        if restored is not None:
+            offset, state = restored
+            self.tables = state['tables']
+            for name, analyzer in state['analyzers'].items():
+                setattr(self, f"{name}_analyzer", analyzer)
+            print(f"Resuming {loader.file_path} from byte {offset:,}")
+        else:
+            offset = 0
+            self.tables = None
+            self._create_analyzers()
+        
+        self.update(offset)
+        self.save_state()
+        self._load_also_likes_table()
+    
+    def save_state(self):
+        """Save the analyzers and the byte offset they cover, for ingest_incremental"""
+        loader = self.data_loader
+        if loader.use_cache and loader.last_error is None:
+            save_state(loader.file_path, loader.cache_dir, loader.offset,
+                       {'tables': self.tables, 'analyzers': self._consumers()})
+    
+    def update(self, offset=None, report=True):
+        """Feed the events appended after `offset` (default: where the last update stopped)
+
+        Returns the number of new events consumed.
+        """
+        loader = self.data_loader
+        offset = loader.offset if offset is None else offset
+        count = 0
+        for chunk in loader.iter_tail_chunks(offset, self.tables, report):
+            self.tables = chunk.tables
+            count += len(chunk)
+            for consumer in self._consumers().values():
+                consumer.consume(chunk)
+        if count:
+            # The precomputed rankings no longer cover every event
+            self.also_likes_table = None
+        return count
+    
+    def live_snapshot(self, doc_uuid=None, top_n=10):
+        """Current aggregates of follow mode: top readers, browsers and a document's countries"""
+        snapshot = {
+            'file': self.data_loader.file_path,
+            'offset': self.data_loader.offset,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'top_readers': self.reader_analyzer.get_top_readers(top_n),
+            'browsers': self.browser_analyzer.get_browser_counts(),
+        }
+        if doc_uuid:
+            snapshot['doc_uuid'] = doc_uuid
+            snapshot['countries'] = self.country_analyzer.get_views_by_country(doc_uuid)
+        return snapshot
+    
+    def print_live_snapshot(self, snapshot):
+        print(f"\n[{snapshot['time']}] {snapshot['file']} at byte {snapshot['offset']:,}")
+        print("  Top readers:")
+        for rank, (visitor_uuid, total_time) in enumerate(snapshot['top_readers'], 1):
+            print(f"    {rank:>3}. {visitor_uuid:<40} {total_time:>12,}s")
+        print("  Browsers:")
+        for browser, count in sorted(snapshot['browsers'].items(), key=lambda x: x[1], reverse=True):
+            print(f"    {browser:20s}: {count:,}")
+        if 'countries' in snapshot:
+            print(f"  Countries of {snapshot['doc_uuid']}:")
+            for country, count in sorted(snapshot['countries'].items(), key=lambda x: x[1], reverse=True):
+                print(f"    {country:20s}: {count:,}")
+    
+    def follow(self, interval=10.0, poll_interval=1.0, doc_uuid=None, top_n=10,
+               export_path=None, max_snapshots=None, checkpoint_interval=300.0):
+        """Tail the data file like `tail -f`, keeping every analyzer live
+
+        New events are consumed as they are appended. Every `interval`
+        seconds the live aggregates are printed (and written as JSON to
+        `export_path`). The incremental state is pickled whole, so it is
+        only saved every `checkpoint_interval` seconds when new events came
+        in, and on exit; after a crash the events since the last
+        checkpoint are simply read again. Runs until interrupted, or until
+        `max_snapshots` snapshots were taken.
+        """
+        loader = self.data_loader
+        self.ingest_incremental()
+        snapshots = 0
+        unsaved = 0
+        next_snapshot = time.monotonic()
+        next_checkpoint = time.monotonic() + checkpoint_interval
+        print(f"Following {loader.file_path} (Ctrl+C to stop)")
+        try:
+            while True:
+                if not os.path.exists(loader.file_path):
+                    # Rotated away, wait for the writer to recreate it
+                    time.sleep(poll_interval)
+                    continue
+                if os.path.getsize(loader.file_path) < loader.offset:
+                    print(f"{loader.file_path} was truncated, starting over")
+                    self._create_analyzers()
+                    self.tables = None
+                    loader.offset = 0
+                unsaved += self.update(report=False)
+                
+                if time.monotonic() >= next_snapshot:
+                    snapshot = self.live_snapshot(doc_uuid, top_n)
+                    self.print_live_snapshot(snapshot)
+                    if export_path:
+                        tmp_path = f"{export_path}.tmp"
+                        with open(tmp_path, 'w', encoding='utf-8') as file:
+                            json.dump(snapshot, file, indent=2)
+                        os.replace(tmp_path, export_path)
+                    snapshots += 1
+                    if max_snapshots is not None and snapshots >= max_snapshots:
+                        break
+                    next_snapshot = time.monotonic() + interval
+                if unsaved and time.monotonic() >= next_checkpoint:
+                    self.save_state()
+                    unsaved = 0
+                    next_checkpoint = time.monotonic() + checkpoint_interval
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print("\nStopped following")
+        finally:
+            self.save_state()
     
     def load_data(self):
-        return self.data
+        """Re-read the raw records (the analyzers only keep their indices)"""
+        return self.data_loader.load_data()
+    
+    def _load_also_likes_table(self):
+        loader = self.data_loader
+        self.also_likes_table = load_table(loader.file_path, loader.cache_dir) if loader.use_cache else None
+    
+    def build_also_likes_table(self, top_k=10, min_readers=1, workers=1):
+        """Precompute the top-K also-likes of every document with at least min_readers readers
+
+        The table is saved next to the file's snapshot and loaded by later
+        runs on the same file contents, so get_also_likes can answer most
+        queries with a lookup.
+        """
+        started = time.perf_counter()
+        table = AlsoLikesTable.build(self.recommendation_analyzer, top_k, min_readers, workers)
+        loader = self.data_loader
+        # Saved tables answer later queries on the whole file, so a table of
+        # a time window or of a failed read is only kept in memory
+        if loader.use_cache and loader.window is None and loader.last_error is None:
+            save_table(table, loader.file_path, loader.cache_dir)
+        self.also_likes_table = table
+        print(f"Built top-{top_k} also-likes table for {len(table)} documents "
+              f"in {time.perf_counter() - started:.2f}s")
+        return table
+    
+    def save_rollups(self, directory, merge=False):
+        """Save the rollup cubes of the last ingest to directory
+
+        With merge the cubes already saved there (e.g. from other files or
+        earlier periods) are added to the new ones first.
+        """
+        if self.rollup_analyzer is None:
+            raise ValueError("No rollup cubes were built, ingest with rollups=True first")
+        if merge and os.path.exists(os.path.join(directory, 'views-hour.npz')):
+            self.rollup_analyzer.merge(RollupAnalyzer.load(directory))
+        self.rollup_analyzer.save(directory)
     
     # Methods for tasks 5-8
-    def get_also_likes(self, doc_uuid, visitor_uuid=None):
-        return self.recommendation_analyzer.get_top_also_likes(doc_uuid, visitor_uuid)
+    def get_also_likes(self, doc_uuid, visitor_uuid=None, top_n=10):
+        """Task 5d, answered from the precomputed table whenever its ranking still holds"""
+        if self.also_likes_table is not None:
+            visitor_documents = None
+            if visitor_uuid:
+                analyzer = self.recommendation_analyzer
+                visitor_code = analyzer._code('visitor', visitor_uuid)
+                if visitor_code is not None:
+                    visitor_documents = analyzer.visitor_documents.row(visitor_code)[0]
+            result = self.also_likes_table.lookup(doc_uuid, top_n, visitor_documents)
+            if result is not None:
+                return result
+        return self.recommendation_analyzer.get_top_also_likes(doc_uuid, visitor_uuid, top_n)
     
     def generate_also_likes_graph(self, doc_uuid, visitor_uuid=None):
         graph_data = self.recommendation_analyzer.get_also_likes_graph_data(doc_uuid, visitor_uuid)
@@ -0,0 +1,175 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from analyzers.recommendation import RecommendationAnalyzer
+from data.snapshot import _source_key
+
+# Documents ranked per task handed to one worker
+BLOCK_SIZE = 256
+
+_worker_analyzer = None
+
+
+def _init_worker(visitor_documents, document_visitors, doc_table):
+    global _worker_analyzer
+    _worker_analyzer = RecommendationAnalyzer()
+    # Ties are ranked by document UUID
+    _worker_analyzer.tables = {'doc': doc_table}
+    _worker_analyzer.visitor_documents = visitor_documents
+    _worker_analyzer.document_visitors = document_visitors
+
+
+def _rank_block(doc_codes, top_k):
+    return _worker_analyzer.top_also_likes_codes_batch(doc_codes, top_n=top_k)
+
+
+class AlsoLikesTable:
+    """Precomputed top-K also-likes of every (popular) document
+
+    Rows are stored in CSR form: the ranked document codes and reader
+    counts of document code d are indices/counts[indptr[d]:indptr[d + 1]].
+    Documents below the reader threshold have no row.
+    """
+
+    def __init__(self, documents: List[str], top_k: int, has_row: np.ndarray,
+                 indptr: np.ndarray, indices: np.ndarray, counts: np.ndarray):
+        self.documents = documents
+        self.top_k = top_k
+        self.has_row = has_row
+        self.indptr = indptr
+        self.indices = indices
+        self.counts = counts
+        self.index = {doc_uuid: code for code, doc_uuid in enumerate(documents)}
+
+    def __len__(self):
+        return int(np.count_nonzero(self.has_row))
+
+    def row(self, doc_uuid: str):
+        """Ranked (document codes, reader counts) of a document, None if it has no row"""
+        code = self.index.get(doc_uuid)
+        if code is None or not self.has_row[code]:
+            return None
+        start, end = self.indptr[code], self.indptr[code + 1]
+        return self.indices[start:end], self.counts[start:end]
+
+    def lookup(self, doc_uuid: str, top_n: int = 10,
+               visitor_documents: Optional[np.ndarray] = None) -> Optional[List[str]]:
+        """Top also-likes of a document from the table, None when it cannot answer
+
+        `visitor_documents` are the codes of the documents read by the
+        visitor excluded from the query, if any. Excluding a visitor lowers
+        by one the count of every document they read, and only if they read
+        the queried document. The stored ranking still holds when they did
+        not, or when none of the ranked documents is among theirs, because
+        documents outside the top K can only lose readers.
+        """
+        row = self.row(doc_uuid)
+        if row is None:
+            return None
+        codes, _ = row
+        # A short row holds every co-read document, so any top_n is answered
+        if top_n > self.top_k and len(codes) >= self.top_k:
+            return None
+        if visitor_documents is not None and self.index[doc_uuid] in visitor_documents:
+            if np.isin(codes[:top_n], visitor_documents).any():
+                return None
+        return [self.documents[code] for code in codes[:top_n].tolist()]
+
+    @classmethod
+    def build(cls, analyzer: RecommendationAnalyzer, top_k: int = 10, min_readers: int = 1,
+              workers: int = 1) -> 'AlsoLikesTable':
+        """Rank the top-K also-likes of every document with at least min_readers readers
+
+        Documents are ranked in blocks, each one a batched sparse product,
+        on `workers` processes.
+        """
+        documents = list(analyzer.tables['doc'].values) if analyzer.tables else ['']
+        # Workers receive the matrices already compacted
+        analyzer.visitor_documents.compact()
+        analyzer.document_visitors.compact()
+        readers = np.diff(analyzer.document_visitors.indptr)
+        readers = np.concatenate([readers, np.zeros(len(documents) - len(readers), dtype=np.int64)])
+        has_row = readers >= max(min_readers, 1)
+        doc_codes = np.flatnonzero(has_row)
+        blocks = [doc_codes[start:start + BLOCK_SIZE].tolist()
+                  for start in range(0, len(doc_codes), BLOCK_SIZE)]
+
+        # Nothing to rank (e.g. no read events) needs no pool
+        if workers <= 1 or not blocks:
+            ranked = [analyzer.top_also_likes_codes_batch(block, top_n=top_k) for block in blocks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(analyzer.visitor_documents,
+                                               analyzer.document_visitors,
+                                               analyzer.tables['doc'])) as executor:
+                ranked = list(executor.map(_rank_block, blocks, [top_k] * len(blocks)))
+
+        lengths = np.zeros(len(documents), dtype=np.int64)
+        rows = [row for block in ranked for row in block]
+        lengths[doc_codes] = [len(codes) for codes, _ in rows]
+        indptr = np.zeros(len(documents) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # Rows were ranked in ascending document code, so they concatenate in CSR order
+        indices = np.concatenate([codes for codes, _ in rows] + [np.zeros(0, dtype=np.int64)])
+        counts = np.concatenate([counts for _, counts in rows] + [np.zeros(0, dtype=np.int64)])
+        return cls(documents, top_k, has_row, indptr,
+                   indices.astype(np.int32), counts.astype(np.int32))
+
+    def save(self, path: str):
+        # Document ids are stored as one newline-joined UTF-8 buffer rather
+        # than a fixed-width string array
+        names = '\n'.join(self.documents).encode('utf-8')
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, documents=np.frombuffer(names, dtype=np.uint8),
+                 top_k=np.array(self.top_k), has_row=self.has_row, indptr=self.indptr,
+                 indices=self.indices, counts=self.counts)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['AlsoLikesTable']:
+        try:
+            with np.load(path) as arrays:
+                documents = arrays['documents'].tobytes().decode('utf-8').split('\n')
+                return cls(documents, int(arrays['top_k']), arrays['has_row'], arrays['indptr'],
+                           arrays['indices'], arrays['counts'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def table_path(source_path: str, cache_dir: str) -> str:
+    """Table file for the current contents of source_path"""
+    return os.path.join(cache_dir, f"also-likes-{_source_key(source_path)[1]}.npz")
+
+
+def save_table(table: AlsoLikesTable, source_path: str, cache_dir: str):
+    """Persist a table built from source_path, replacing tables of older versions of the file
+
+    Returns whether the table was saved; a missing source file or an
+    unwritable cache only cost the reuse of the table.
+    """
+    try:
+        path = table_path(source_path, cache_dir)
+        prefix = f"also-likes-{_source_key(source_path)[0]}-"
+        for entry in os.listdir(cache_dir):
+            if entry.startswith(prefix) and entry.endswith('.npz'):
+                os.remove(os.path.join(cache_dir, entry))
+        table.save(path)
+    except OSError as e:
+        print(f"Warning: could not save the also-likes table: {e}")
+        return False
+    return True
+
+
+def load_table(source_path: str, cache_dir: str) -> Optional[AlsoLikesTable]:
+    """Table built from the current contents of source_path, None if there is none"""
+    try:
+        path = table_path(source_path, cache_dir)
+    except OSError:
+        return None
+    if not os.path.exists(path):
+        return None
+    return AlsoLikesTable.load(path)
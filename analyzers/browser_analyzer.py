@@ -1,38 +1,94 @@
 import matplotlib.pyplot as plt
-from collections import Counter
 import sys
 import os
+import numpy as np
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from utils.browser_parser import BrowserParser
+from data.event_store import ChunkConsumer, grow
 
 
-class BrowserAnalyzer:
+class BrowserAnalyzer(ChunkConsumer):
     """Analyzes document views by browser"""
     
-    def __init__(self, data):
-        self.data = data
+    COLUMNS = ('useragent',)
+    # Every event is a view
+    EVENT_TYPES = None
+    
+    def __init__(self, data=None, window=None):
+        super().__init__(window)
         self.browser_parser = BrowserParser()
+        # Views per user agent code of the event store (dense, indexed by code,
+        # may be longer than the user agent table)
+        self.useragent_counts = np.zeros(0, dtype=np.int64)
+        # Browser family code of every user agent code classified so far
+        self.family_codes = np.zeros(0, dtype=np.int32)
+        self.families = []
+        self._family_index = {}
+        
+        if data is not None:
+            self.consume(data)
     
-    def get_raw_browser_counts(self):
-        browser_counts = Counter()
+    def consume_chunk(self, chunk):
+        self.useragent_counts = grow(self.useragent_counts, len(self.tables['useragent']))
+        np.add.at(self.useragent_counts, chunk.columns['useragent'], 1)
+    
+    def _classify_new_useragents(self):
+        """Extend family_codes to every user agent code, classifying each one only once"""
+        n_codes = len(self.tables['useragent'])
+        known = len(self.family_codes)
+        if known >= n_codes:
+            return
+        useragents = self.tables['useragent'].values
+        new_codes = np.empty(n_codes - known, dtype=np.int32)
+        for i, useragent in enumerate(useragents[known:n_codes]):
+            browser_name = self.browser_parser.classify(useragent)
+            if browser_name not in self._family_index:
+                self._family_index[browser_name] = len(self.families)
+                self.families.append(browser_name)
+            new_codes[i] = self._family_index[browser_name]
+        self.family_codes = np.concatenate([self.family_codes, new_codes])
+    
+    def family_indices(self, useragent_codes):
+        """Index into self.families of the browser family of each user agent code"""
+        self._classify_new_useragents()
+        return self.family_codes[useragent_codes]
+    
+    def get_browser_histograms(self):
+        """Raw user agent and browser family histograms (tasks 3a and 3b) in one pass
         
-        for record in self.data:
-            useragent = record.get('visitor_useragent', '')
-            if useragent:
-                browser_counts[useragent] += 1
+        The work grows with the number of distinct user agents: each one is
+        classified once and the family counts are sums of the raw counts.
+        """
+        if self.tables is None:
+            return {}, {}
+        self._classify_new_useragents()
         
-        return dict(browser_counts)
+        useragents = self.tables['useragent'].values
+        # Code 0 is a missing user agent
+        seen = np.flatnonzero(self.useragent_counts[1:]) + 1
+        counts = self.useragent_counts[seen]
+        raw_counts = dict(zip([useragents[code] for code in seen.tolist()], counts.tolist()))
+        
+        family_totals = np.bincount(self.family_codes[seen], weights=counts,
+                                    minlength=len(self.families)).astype(np.int64)
+        browser_counts = {self.families[family]: int(family_totals[family])
+                          for family in np.flatnonzero(family_totals).tolist()}
+        # A missing user agent still counts as a view of an unknown browser
+        if len(self.useragent_counts) and self.useragent_counts[0]:
+            unknown = self.browser_parser.classify('')
+            browser_counts[unknown] = browser_counts.get(unknown, 0) + int(self.useragent_counts[0])
+        return raw_counts, browser_counts
+    
+    def get_raw_browser_counts(self):
+        return self.get_browser_histograms()[0]
     
     def get_browser_counts(self):
-        browser_counts = Counter()
-        
-        for record in self.data:
-            useragent = record.get('visitor_useragent', '')
-            browser_name = self.browser_parser.extract_browser_name(useragent)
-            browser_counts[browser_name] += 1
-        
-        return dict(browser_counts)
+        return self.get_browser_histograms()[1]
+    
+    def get_classification_stats(self):
+        """Cache hit/miss statistics of the user agent classifier"""
+        return self.browser_parser.cache_stats()
     
     def plot_raw_browser_histogram(self, top_n=15):
         browser_counts = self.get_raw_browser_counts()
@@ -1,50 +1,90 @@
 import matplotlib.pyplot as plt
-from collections import Counter
 import sys
 import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from utils.country_mapper import CountryMapper
+from utils.sparse_matrix import SparseCountMatrix
+from data.event_store import ChunkConsumer
 
 
-class CountryAnalyzer:
+class CountryAnalyzer(ChunkConsumer):
     """Analyzes document views by country and continent"""
     
-    def __init__(self, data):
-        self.data = data
-        self.country_mapper = CountryMapper()
+    COLUMNS = ('doc', 'country', 'continent')
+    # Every event is a view
+    EVENT_TYPES = None
     
-    def get_views_by_country(self, doc_uuid):
-        country_counts = Counter()
+    def __init__(self, data=None, window=None):
+        super().__init__(window)
+        self.country_mapper = CountryMapper()
+        # Inverted indices from document code to its (country code, views)
+        # and (continent code, views) postings
+        self.country_counts = SparseCountMatrix()
+        self.continent_counts = SparseCountMatrix()
         
-        for record in self.data:
-            if record.get('env_doc_id') == doc_uuid:
-                country = record.get('visitor_country', '')
-                if country:
-                    country_counts[country] += 1
+        if data is not None:
+            self.consume(data)
+    
+    def consume_chunk(self, chunk):
+        doc = chunk.columns['doc']
+        has_doc = doc != 0
         
-        return dict(country_counts)
+        country = chunk.columns['country']
+        has_country = has_doc & (country != 0)
+        self.country_counts.add(doc[has_country], country[has_country])
+        self.continent_counts.add(doc[has_doc], chunk.columns['continent'][has_doc])
+    
+    def _decode_counts(self, counts, doc_uuid, column):
+        if self.tables is None:
+            return {}
+        codes, views = counts.row(self.tables['doc'].lookup(doc_uuid))
+        values = self.tables[column].values
+        return {values[code]: count for code, count in zip(codes.tolist(), views.tolist())}
+    
+    def get_views_by_country(self, doc_uuid):
+        return self._decode_counts(self.country_counts, doc_uuid, 'country')
     
     def get_views_by_continent(self, doc_uuid):
-        continent_counts = Counter()
-        
-        for record in self.data:
-            if record.get('env_doc_id') == doc_uuid:
-                # Use the continent from data if available
-                continent = record.get('visitor_continent', '')
-                if continent:
-                    pass  # Use as is
-                else:
-                    # Otherwise map from country code
-                    country = record.get('visitor_country', '')
-                    if country:
-                        continent = self.country_mapper.get_continent(country)
-                    else:
-                        continent = 'Unknown'
-                
-                continent_counts[continent] += 1
+        return self._decode_counts(self.continent_counts, doc_uuid, 'continent')
+    
+    def _decode_histograms(self, counts, doc_uuids, column):
+        doc_uuids = list(doc_uuids)
+        if self.tables is None:
+            return {doc_uuid: {} for doc_uuid in doc_uuids}
         
-        return dict(continent_counts)
+        doc_table = self.tables['doc']
+        indptr, codes, views = counts.take_rows([doc_table.lookup(d) for d in doc_uuids])
+        values = self.tables[column].values
+        codes, views = codes.tolist(), views.tolist()
+        return {doc_uuid: {values[code]: count for code, count
+                           in zip(codes[indptr[i]:indptr[i + 1]], views[indptr[i]:indptr[i + 1]])}
+                for i, doc_uuid in enumerate(doc_uuids)}
+    
+    def get_country_histograms(self, doc_uuids):
+        """Task 2a for many documents at once: {doc_uuid: {country: views}}"""
+        return self._decode_histograms(self.country_counts, doc_uuids, 'country')
+    
+    def get_continent_histograms(self, doc_uuids):
+        """Task 2b for many documents at once: {doc_uuid: {continent: views}}"""
+        return self._decode_histograms(self.continent_counts, doc_uuids, 'continent')
+    
+    def _top_totals(self, counts, column, n):
+        if self.tables is None:
+            return []
+        totals = counts.column_totals()
+        values = self.tables[column].values
+        ranked = sorted(((values[code], int(total)) for code, total in enumerate(totals) if total),
+                        key=lambda x: (-x[1], x[0]))
+        return ranked[:n] if n is not None else ranked
+    
+    def get_top_countries(self, n=None):
+        """Countries with the most views across all documents, as (country, views) pairs"""
+        return self._top_totals(self.country_counts, 'country', n)
+    
+    def get_top_continents(self, n=None):
+        """Continents with the most views across all documents, as (continent, views) pairs"""
+        return self._top_totals(self.continent_counts, 'continent', n)
     
     def plot_country_histogram(self, doc_uuid, top_n=20):
         country_counts = self.get_views_by_country(doc_uuid)
@@ -1,40 +1,66 @@
-from collections import defaultdict
+import sys
+import os
+import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from data.event_store import ChunkConsumer, grow
 
-class ReaderAnalyzer:
+
+class ReaderAnalyzer(ChunkConsumer):
     """Analyzes reader profiles and reading time"""
     
-    def __init__(self, data):
-        self.data = data
+    COLUMNS = ('visitor', 'readtime', 'event_type')
+    # Only pagereadtime events carry a read time
+    EVENT_TYPES = ('pagereadtime',)
     
-    def get_total_readtime_by_user(self):
-        user_readtime = defaultdict(int)
+    def __init__(self, data=None, window=None):
+        super().__init__(window)
+        # Total read time per visitor code of the event store (dense, indexed by
+        # code, may be longer than the visitor table)
+        self.user_readtime = np.zeros(0, dtype=np.int64)
         
-        for record in self.data:
-            visitor_uuid = record.get('visitor_uuid', '')
-            readtime = record.get('event_readtime', 0)
-            
-            if visitor_uuid and readtime:
-                try:
-                    readtime_int = int(readtime)
-                    if readtime_int > 0:
-                        user_readtime[visitor_uuid] += readtime_int
-                except (ValueError, TypeError):
-                    continue
-        
-        return dict(user_readtime)
+        if data is not None:
+            self.consume(data)
+    
+    def consume_chunk(self, chunk):
+        visitor = chunk.columns['visitor']
+        readtime = chunk.columns['readtime']
+        has_readtime = (visitor != 0) & (readtime > 0)
+        self.user_readtime = grow(self.user_readtime, len(self.tables['visitor']))
+        np.add.at(self.user_readtime, visitor[has_readtime],
+                  readtime[has_readtime].astype(np.int64))
+    
+    def get_total_readtime_by_user(self):
+        if self.tables is None:
+            return {}
+        visitors = self.tables['visitor'].values
+        codes = np.flatnonzero(self.user_readtime)
+        return dict(zip([visitors[code] for code in codes.tolist()],
+                        self.user_readtime[codes].tolist()))
     
     def get_top_readers(self, n=10):
-        readtimes = self.get_total_readtime_by_user()
+        """The n visitors with the most read time, as (visitor_uuid, total) pairs
         
-        # Sort by readtime (descending)
-        sorted_readers = sorted(
-            readtimes.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )
+        argpartition finds the n-th largest total in linear time and only the
+        visitors at or above it are decoded and sorted. Ties are broken by
+        visitor UUID, which unlike the codes does not depend on how the
+        file was read.
+        """
+        if self.tables is None or n <= 0:
+            return []
+        totals = self.user_readtime
+        readers = np.count_nonzero(totals)
+        n = min(n, readers)
+        if n == 0:
+            return []
         
-        return sorted_readers[:n]
+        threshold = totals[np.argpartition(totals, len(totals) - n)[len(totals) - n]]
+        candidates = np.flatnonzero(totals >= threshold)
+        visitors = self.tables['visitor'].values
+        names = np.array([visitors[code] for code in candidates.tolist()])
+        # Highest total first, then by UUID
+        top = candidates[np.lexsort((names, -totals[candidates]))][:n]
+        return [(visitors[code], total) for code, total in zip(top.tolist(), totals[top].tolist())]
     
     def print_top_readers(self, n=10):
         top_readers = self.get_top_readers(n)
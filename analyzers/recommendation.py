@@ -1,77 +1,342 @@
-from collections import defaultdict
-from typing import Dict, List, Set, Callable, Optional
+from typing import AbstractSet, Dict, List, Callable, Optional, Tuple
+import sys
+import os
+import time
+import numpy as np
 
-class RecommendationAnalyzer:
-    def __init__(self, data_loader):
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from data.event_store import ChunkConsumer, CodeSet
+from utils.sparse_matrix import SparseCountMatrix
+from utils.lru_cache import LRUCache
+from utils.minhash import MinHashLSH
+
+class RecommendationAnalyzer(ChunkConsumer):
+    COLUMNS = ('visitor', 'doc', 'event_type')
+    # A visitor is a reader once they opened the document, impressions do not count
+    EVENT_TYPES = ('read', 'pageread', 'pagereadtime')
+    
+    def __init__(self, data_loader=None, cache_size: int = 1024, cache_ttl: Optional[float] = 300,
+                 window: Optional[Tuple[Optional[int], Optional[int]]] = None):
+        super().__init__(window)
         self.data_loader = data_loader
-        self.visitor_to_documents: Dict[str, Set[str]] = defaultdict(set)
-        self.document_to_visitors: Dict[str, Set[str]] = defaultdict(set)
-        self._build_indices()
+        # Visitor x document incidence matrix and its transpose: CSR adjacency
+        # of the integer codes of the event store string tables (which intern
+        # the UUIDs), each row a sorted array of neighbour codes. They answer
+        # tasks 5a/5b and the co-visitation products of also-likes.
+        self.visitor_documents = SparseCountMatrix(binary=True)
+        self.document_visitors = SparseCountMatrix(binary=True)
+        # Results of repeated also-likes and graph queries, dropped on every update
+        self.query_cache = LRUCache(cache_size, cache_ttl)
+        # Approximate also-likes (MinHash/LSH over reader sets), off by default
+        self.approximate = None
+        self.lsh = None
+        if data_loader is not None:
+            self._build_indices()
     
     def _build_indices(self):
         """Build indices for efficient lookup"""
         print("Building recommendation indices...")
-        for entry in self.data_loader.load_data():
-            visitor_uuid = entry.get('visitor_uuid')
-            document_uuid = entry.get('env_doc_id')  # Note: using 'env_doc_id' from your friend's code
-            
-            if visitor_uuid and document_uuid:
-                self.visitor_to_documents[visitor_uuid].add(document_uuid)
-                self.document_to_visitors[document_uuid].add(visitor_uuid)
+        self.consume(self.data_loader.iter_chunks())
         print("Indices built successfully")
     
-    def get_visitors_of_document(self, doc_uuid: str) -> Set[str]:
-        """Task 5a: Get all visitor UUIDs of readers of a document"""
-        return self.document_to_visitors.get(doc_uuid, set())
+    def consume_chunk(self, chunk):
+        self.query_cache.clear()
+        self.lsh = None
+        visitor = chunk.columns['visitor']
+        doc = chunk.columns['doc']
+        valid = (visitor != 0) & (doc != 0)
+        
+        # Each distinct (visitor, document) pair only needs adding once
+        pairs = np.unique((visitor[valid].astype(np.int64) << 32) | doc[valid])
+        visitor_codes, doc_codes = pairs >> 32, pairs & 0xFFFFFFFF
+        self.visitor_documents.add(visitor_codes, doc_codes)
+        self.document_visitors.add(doc_codes, visitor_codes)
     
-    def get_documents_of_visitor(self, visitor_uuid: str) -> Set[str]:
-        """Task 5b: Get all document UUIDs read by a visitor"""
-        return self.visitor_to_documents.get(visitor_uuid, set())
+    def get_cache_stats(self) -> Dict:
+        """Hit rate, size and eviction counters of the query cache"""
+        return self.query_cache.stats()
     
-    def also_likes(self, doc_uuid: str, sorting_func: Callable, 
-                   visitor_uuid: Optional[str] = None) -> List[str]:
-        """Task 5c: Also likes functionality with custom sorting"""
-        readers = self.get_visitors_of_document(doc_uuid)
+    def _code(self, column: str, value: Optional[str]) -> Optional[int]:
+        if self.tables is None:
+            return None
+        return self.tables[column].lookup(value)
+    
+    def get_visitors_of_document(self, doc_uuid: str) -> AbstractSet[str]:
+        """Task 5a: Get all visitor UUIDs of readers of a document (a view, decoded lazily)"""
+        if self.tables is None:
+            return set()
+        readers, _ = self.document_visitors.row(self._code('doc', doc_uuid))
+        return CodeSet(readers, self.tables['visitor'])
+    
+    def get_documents_of_visitor(self, visitor_uuid: str) -> AbstractSet[str]:
+        """Task 5b: Get all document UUIDs read by a visitor (a view, decoded lazily)"""
+        if self.tables is None:
+            return set()
+        documents, _ = self.visitor_documents.row(self._code('visitor', visitor_uuid))
+        return CodeSet(documents, self.tables['doc'])
+    
+    def also_likes_counts(self, doc_code: Optional[int], visitor_code: Optional[int] = None):
+        """Codes of the documents co-read with a document and their reader counts
+
+        The readers of the document form a sparse indicator vector; its
+        product with the visitor x document incidence matrix counts, per
+        document, how many of them read it. Only the rows of those readers
+        are touched. The document codes come back in ascending order.
+        """
+        readers, _ = self.document_visitors.row(doc_code)
+        if visitor_code is not None:
+            readers = readers[readers != visitor_code]
+        _, documents, _ = self.visitor_documents.take_rows(readers)
+        # A document is in a visitor's row at most once, so each occurrence is one reader
+        documents, counts = np.unique(documents, return_counts=True)
+        others = documents != doc_code
+        return documents[others], counts[others]
+    
+    def enable_approximate(self, num_perm: int = 64, bands: int = 32, min_readers: int = 1000,
+                           sample_size: int = 256, rerank: int = 100):
+        """Answer also-likes of documents with at least min_readers readers approximately
+
+        Candidates come from MinHash signatures of the documents' reader
+        sets: documents colliding with the queried one in an LSH band
+        (similar audiences), plus the documents read by a bottom-k MinHash
+        sample of `sample_size` of its readers (the popular co-reads that
+        Jaccard similarity misses). The `rerank` candidates read most by
+        the sample then get exact co-reader counts. Larger samples, more
+        bands and more reranked candidates raise recall and latency;
+        `benchmark_approximate` reports the recall@10 of a setting.
+        """
+        self.approximate = {'num_perm': num_perm, 'bands': bands, 'min_readers': min_readers,
+                            'sample_size': sample_size, 'rerank': rerank}
+        self.lsh = None
+        self.query_cache.clear()
+    
+    def disable_approximate(self):
+        self.approximate = None
+        self.lsh = None
+        self.query_cache.clear()
+    
+    def _lsh_index(self) -> MinHashLSH:
+        # Built on first use after every update
+        if self.lsh is None:
+            self.document_visitors.compact()
+            self.lsh = MinHashLSH(self.approximate['num_perm'], self.approximate['bands']).build(
+                self.document_visitors.indptr, self.document_visitors.indices)
+        return self.lsh
+    
+    def _is_approximated(self, doc_code: Optional[int]) -> bool:
+        if self.approximate is None or doc_code is None:
+            return False
+        readers, _ = self.document_visitors.row(doc_code)
+        return len(readers) >= self.approximate['min_readers']
+    
+    def approximate_also_likes_counts(self, doc_code: Optional[int], visitor_code: Optional[int] = None):
+        """Like also_likes_counts, restricted to the best approximate candidates of the document
+
+        The counts of the returned documents are exact; documents that are
+        not candidates are missed.
+        """
+        readers, _ = self.document_visitors.row(doc_code)
+        if visitor_code is not None:
+            readers = readers[readers != visitor_code]
+        lsh = self._lsh_index()
+        
+        _, sampled, _ = self.visitor_documents.take_rows(lsh.bottom_k(readers, self.approximate['sample_size']))
+        sampled, votes = np.unique(sampled, return_counts=True)
+        similar = lsh.candidates(doc_code)
+        candidates = np.union1d(sampled[sampled != doc_code], similar)
+        if len(candidates) > self.approximate['rerank']:
+            # Similar documents first, then the co-reads most frequent in the sample
+            score = np.zeros(len(candidates), dtype=np.int64)
+            score[np.searchsorted(candidates, sampled[sampled != doc_code])] = votes[sampled != doc_code]
+            score[np.searchsorted(candidates, similar)] = np.iinfo(np.int64).max
+            keep = np.argpartition(-score, self.approximate['rerank'])[:self.approximate['rerank']]
+            candidates = np.sort(candidates[keep])
+        
+        # Exact counts: how many of each candidate's readers also read the document
+        is_reader = np.zeros(self.visitor_documents.n_rows, dtype=bool)
+        is_reader[readers] = True
+        indptr, candidate_readers, _ = self.document_visitors.take_rows(candidates)
+        owners = np.repeat(np.arange(len(candidates)), np.diff(indptr))
+        counts = np.bincount(owners[is_reader[candidate_readers]], minlength=len(candidates))
+        found = counts > 0
+        return candidates[found], counts[found]
+    
+    def benchmark_approximate(self, doc_uuids: Optional[List[str]] = None, top_n: int = 10,
+                              sample: int = 50) -> Dict:
+        """Recall@top_n and latency of approximate against exact also-likes
+
+        Runs on the given documents, by default the `sample` most read ones.
+        """
+        if self.approximate is None:
+            self.enable_approximate()
+        if doc_uuids is None:
+            self.document_visitors.compact()
+            popular = np.argsort(-np.diff(self.document_visitors.indptr), kind='stable')[:sample]
+            doc_codes = [code for code in popular.tolist() if code]
+        else:
+            doc_codes = [code for code in (self._code('doc', doc_uuid) for doc_uuid in doc_uuids)
+                         if code is not None]
         
-        if visitor_uuid and visitor_uuid in readers:
-            readers.remove(visitor_uuid)
+        started = time.perf_counter()
+        self._lsh_index()
+        index_seconds = time.perf_counter() - started
         
-        also_liked_docs = defaultdict(int)
+        exact_seconds = approx_seconds = 0.0
+        recalls, candidates = [], []
+        for doc_code in doc_codes:
+            started = time.perf_counter()
+            exact = self._rank(*self.also_likes_counts(doc_code), top_n)[0]
+            exact_seconds += time.perf_counter() - started
+            
+            started = time.perf_counter()
+            codes, counts = self.approximate_also_likes_counts(doc_code)
+            approx = self._rank(codes, counts, top_n)[0]
+            approx_seconds += time.perf_counter() - started
+            
+            candidates.append(len(codes))
+            if len(exact):
+                recalls.append(len(np.intersect1d(exact, approx)) / len(exact))
         
-        for reader in readers:
-            reader_docs = self.get_documents_of_visitor(reader)
-            for doc in reader_docs:
-                if doc != doc_uuid:
-                    also_liked_docs[doc] += 1
+        report = {
+            'documents': len(doc_codes),
+            f'recall@{top_n}': float(np.mean(recalls)) if recalls else 1.0,
+            'mean_candidates': float(np.mean(candidates)) if candidates else 0.0,
+            'exact_ms': 1000 * exact_seconds / max(len(doc_codes), 1),
+            'approximate_ms': 1000 * approx_seconds / max(len(doc_codes), 1),
+            'index_seconds': index_seconds,
+            **self.approximate,
+        }
+        print(f"Approximate also-likes on {report['documents']} documents "
+              f"({report['num_perm']} hashes, {report['bands']} bands): "
+              f"recall@{top_n} {report[f'recall@{top_n}']:.3f}, "
+              f"{report['approximate_ms']:.2f} ms vs {report['exact_ms']:.2f} ms exact per query, "
+              f"{report['mean_candidates']:.0f} candidates, index built in {index_seconds:.2f}s")
+        return report
+    
+    def also_likes(self, doc_uuid: str, sorting_func: Callable, 
+                   visitor_uuid: Optional[str] = None) -> List[str]:
+        """Task 5c: Also likes functionality with custom sorting"""
+        doc_code = self._code('doc', doc_uuid)
+        if doc_code is None:
+            return []
+        codes, counts = self.also_likes_counts(doc_code, self._code('visitor', visitor_uuid))
         
-        sorted_docs = sorted(also_liked_docs.items(), key=sorting_func, reverse=True)
+        documents = self.tables['doc'].values
+        sorted_docs = sorted(((documents[doc], count) for doc, count in zip(codes.tolist(), counts.tolist())),
+                             key=sorting_func, reverse=True)
         return [doc for doc, count in sorted_docs]
     
+    def _rank(self, codes: np.ndarray, counts: np.ndarray, top_n: int):
+        """Most readers first, ties by document UUID
+
+        Codes depend on which lines were decoded (snapshot, event type
+        filter), so ties are broken on the UUIDs themselves. Only the
+        documents at or above the top_n-th count are decoded.
+        """
+        if len(codes) > top_n > 0:
+            threshold = np.partition(counts, len(counts) - top_n)[len(counts) - top_n]
+            keep = counts >= threshold
+            codes, counts = codes[keep], counts[keep]
+        documents = self.tables['doc'].values
+        names = np.array([documents[code] for code in codes.tolist()])
+        order = np.lexsort((names, -counts))[:max(top_n, 0)]
+        return codes[order], counts[order]
+    
+    def _decode_list(self, codes: np.ndarray) -> List[str]:
+        documents = self.tables['doc'].values
+        return [documents[code] for code in codes.tolist()]
+    
     def get_top_also_likes(self, doc_uuid: str, visitor_uuid: Optional[str] = None, 
                           top_n: int = 10) -> List[str]:
         """Task 5d: Get top N also liked documents sorted by reader count"""
-        def sorting_func(doc_count_pair):
-            return doc_count_pair[1]
+        doc_code = self._code('doc', doc_uuid)
+        if doc_code is None:
+            return []
+        visitor_code = self._code('visitor', visitor_uuid)
+        
+        def compute():
+            if self._is_approximated(doc_code):
+                codes, counts = self.approximate_also_likes_counts(doc_code, visitor_code)
+            else:
+                codes, counts = self.also_likes_counts(doc_code, visitor_code)
+            return self._decode_list(self._rank(codes, counts, top_n)[0])
+        
+        # Copied so callers cannot change the cached result
+        return list(self.query_cache.get_or_compute(('top', doc_code, visitor_code, top_n), compute))
+    
+    def top_also_likes_codes_batch(self, doc_codes, visitor_code: Optional[int] = None,
+                                   top_n: int = 10):
+        """Ranked (document codes, reader counts) of the top also-likes of many documents
+
+        The reader rows of all queried documents are stacked into a query x
+        visitor matrix and multiplied with the incidence matrix in a single
+        pass, instead of one product per document. Unknown codes (None or
+        negative) get empty results.
+        """
+        doc_codes = np.array([-1 if code is None else code for code in doc_codes], dtype=np.int64)
+        empty = (doc_codes[:0], np.zeros(0, dtype=np.int64))
+        results = [empty] * len(doc_codes)
+        if len(doc_codes) == 0:
+            return results
         
-        all_liked = self.also_likes(doc_uuid, sorting_func, visitor_uuid)
-        return all_liked[:top_n]
+        indptr, readers, _ = self.document_visitors.take_rows(doc_codes)
+        queries = np.repeat(np.arange(len(doc_codes), dtype=np.int64), np.diff(indptr))
+        if visitor_code is not None:
+            keep = readers != visitor_code
+            readers, queries = readers[keep], queries[keep]
+        
+        reader_indptr, documents, _ = self.visitor_documents.take_rows(readers)
+        queries = np.repeat(queries, np.diff(reader_indptr))
+        keys, counts = np.unique((queries << 32) | documents, return_counts=True)
+        queries, documents = keys >> 32, keys & 0xFFFFFFFF
+        others = documents != doc_codes[queries]
+        queries, documents, counts = queries[others], documents[others], counts[others]
+        
+        # Keys are sorted by query, so each query's documents are one slice
+        bounds = np.searchsorted(queries, np.arange(len(doc_codes) + 1))
+        for i in range(len(doc_codes)):
+            start, end = bounds[i], bounds[i + 1]
+            if start < end:
+                results[i] = self._rank(documents[start:end], counts[start:end], top_n)
+        return results
+    
+    def get_top_also_likes_batch(self, doc_uuids: List[str], visitor_uuid: Optional[str] = None,
+                                 top_n: int = 10) -> Dict[str, List[str]]:
+        """Task 5d for many documents at once, as one sparse matrix product"""
+        doc_uuids = list(doc_uuids)
+        if self.tables is None:
+            return {doc_uuid: [] for doc_uuid in doc_uuids}
+        ranked = self.top_also_likes_codes_batch([self._code('doc', doc_uuid) for doc_uuid in doc_uuids],
+                                                 self._code('visitor', visitor_uuid), top_n)
+        return {doc_uuid: self._decode_list(codes) for doc_uuid, (codes, _) in zip(doc_uuids, ranked)}
     
     def get_also_likes_graph_data(self, doc_uuid: str, visitor_uuid: Optional[str] = None) -> Dict:
-        """Get data for generating the also likes graph"""
+        """Get data for generating the also likes graph (cached, do not modify the result)"""
+        return self.query_cache.get_or_compute(
+            ('graph', doc_uuid, visitor_uuid),
+            lambda: self._build_graph_data(doc_uuid, visitor_uuid))
+    
+    def _build_graph_data(self, doc_uuid: str, visitor_uuid: Optional[str] = None) -> Dict:
         also_liked_docs = set(self.get_top_also_likes(doc_uuid, visitor_uuid))
-        input_readers = self.get_visitors_of_document(doc_uuid)
-        
         relevant_readers = set()
-        for reader in input_readers:
-            reader_docs = self.get_documents_of_visitor(reader)
-            if reader_docs.intersection(also_liked_docs):
-                relevant_readers.add(reader)
+        reader_documents = {}
+        if self.tables is not None:
+            # Readers of the document with at least one also-liked document in their row
+            readers, _ = self.document_visitors.row(self._code('doc', doc_uuid))
+            indptr, documents, _ = self.visitor_documents.take_rows(readers)
+            owners = np.repeat(np.arange(len(readers)), np.diff(indptr))
+            also_liked_codes = [self._code('doc', doc) for doc in also_liked_docs]
+            relevant = readers[np.unique(owners[np.isin(documents, also_liked_codes)])]
+            visitors = self.tables['visitor'].values
+            for code in relevant.tolist():
+                relevant_readers.add(visitors[code])
+                reader_documents[visitors[code]] = CodeSet(self.visitor_documents.row(code)[0],
+                                                           self.tables['doc'])
         
         return {
             'input_document': doc_uuid,
             'input_visitor': visitor_uuid,
             'also_liked_documents': also_liked_docs,
             'relevant_readers': relevant_readers,
-            'reader_documents': {reader: self.get_documents_of_visitor(reader) 
-                               for reader in relevant_readers}
+            'reader_documents': reader_documents
         }
\ No newline at end of file
@@ -0,0 +1,118 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from analyzers.browser_analyzer import BrowserAnalyzer
+from analyzers.reader_analyzer import ReaderAnalyzer
+from data.event_store import ChunkConsumer, StringTable
+from utils.rollup_cube import RollupCube
+
+# Bucket sizes of the maintained cubes, finest first
+GRANULARITIES = {'hour': 3600, 'day': 86400}
+
+# Cube name: dimensions besides the time bucket
+CUBES = {
+    'views': ('doc', 'country'),
+    'browsers': ('browser',),
+    'readtime': ('visitor',),
+}
+
+
+class RollupAnalyzer(ChunkConsumer):
+    """Hourly and daily pre-aggregated cubes for dashboards
+
+    Keeps views per document per country, views per browser family and read
+    time per visitor for every hour and day, with the same event selection as
+    CountryAnalyzer, BrowserAnalyzer and ReaderAnalyzer. Any query over whole
+    buckets is answered by summing cells, without the raw events, and cubes
+    of different files or runs can be merged.
+    """
+    
+    COLUMNS = ('doc', 'country', 'useragent', 'visitor', 'readtime', 'ts', 'event_type')
+    # Each cube selects its own events
+    EVENT_TYPES = None
+    
+    def __init__(self, data=None, browser_analyzer=None):
+        super().__init__()
+        # Browser families come from the browser analyzer's memoized classifier
+        self.browser_analyzer = browser_analyzer or BrowserAnalyzer()
+        self.browser_table = StringTable()
+        self.cubes = {granularity: {name: RollupCube(dimensions, seconds)
+                                    for name, dimensions in CUBES.items()}
+                      for granularity, seconds in GRANULARITIES.items()}
+        
+        if data is not None:
+            self.consume(data)
+    
+    def _add(self, name, ts, codes, sources, weights=None):
+        for cubes in self.cubes.values():
+            cubes[name].add(ts, codes, sources, weights)
+    
+    def consume_chunk(self, chunk):
+        columns = chunk.columns
+        ts = columns['ts']
+        
+        doc, country = columns['doc'], columns['country']
+        viewed = (doc != 0) & (country != 0)
+        self._add('views', ts[viewed], {'doc': doc[viewed], 'country': country[viewed]},
+                  self.tables)
+        
+        if self.browser_analyzer.tables is None:
+            self.browser_analyzer.tables = self.tables
+        families = self.browser_analyzer.family_indices(columns['useragent'])
+        # Family index i of the browser analyzer is code i + 1 of browser_table
+        for family in self.browser_analyzer.families[len(self.browser_table) - 1:]:
+            self.browser_table.encode(family)
+        self._add('browsers', ts, {'browser': families + 1}, {'browser': self.browser_table})
+        
+        reads = chunk.select(('visitor', 'readtime', 'ts'), ReaderAnalyzer.EVENT_TYPES).columns
+        visitor, readtime = reads['visitor'], reads['readtime']
+        has_readtime = (visitor != 0) & (readtime > 0)
+        self._add('readtime', reads['ts'][has_readtime], {'visitor': visitor[has_readtime]},
+                  self.tables, readtime[has_readtime])
+    
+    def cube(self, name, start=None, end=None):
+        """The coarsest cube whose buckets line up with both ends of [start, end)"""
+        for granularity, seconds in sorted(GRANULARITIES.items(), key=lambda item: -item[1]):
+            if all(bound is None or bound % seconds == 0 for bound in (start, end)):
+                return self.cubes[granularity][name]
+        return self.cubes['hour'][name]
+    
+    def get_views_by_country(self, doc_uuid, start=None, end=None):
+        return self.cube('views', start, end).query(start, end, {'doc': doc_uuid}, ['country'])
+    
+    def get_views_by_time(self, doc_uuid, granularity='hour', start=None, end=None):
+        """Views of a document per hour or per day, keyed by bucket start time"""
+        return self.cubes[granularity]['views'].query(start, end, {'doc': doc_uuid}, ['bucket'])
+    
+    def get_browser_counts(self, start=None, end=None):
+        return self.cube('browsers', start, end).query(start, end, group_by=['browser'])
+    
+    def get_browser_counts_by_time(self, granularity='day', start=None, end=None):
+        """Views per (bucket start time, browser family)"""
+        return self.cubes[granularity]['browsers'].query(start, end, group_by=['bucket', 'browser'])
+    
+    def get_total_readtime_by_user(self, start=None, end=None):
+        return self.cube('readtime', start, end).query(start, end, group_by=['visitor'])
+    
+    def merge(self, other):
+        """Add the cubes of another RollupAnalyzer, e.g. built from another file"""
+        for granularity, cubes in self.cubes.items():
+            for name, cube in cubes.items():
+                cube.merge(other.cubes[granularity][name])
+    
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for granularity, cubes in self.cubes.items():
+            for name, cube in cubes.items():
+                cube.save(os.path.join(directory, f"{name}-{granularity}.npz"))
+        print(f"Saved rollup cubes to {directory}")
+    
+    @classmethod
+    def load(cls, directory):
+        """Cubes saved by save(); the result can be queried, merged or updated further"""
+        analyzer = cls()
+        for granularity, cubes in analyzer.cubes.items():
+            for name in cubes:
+                cubes[name] = RollupCube.load(os.path.join(directory, f"{name}-{granularity}.npz"))
+        return analyzer
@@ -0,0 +1,103 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from analyzers.recommendation import RecommendationAnalyzer
+from data.event_store import ChunkConsumer
+from utils.sketches import CountMinSketch, KeyedHyperLogLog, SpaceSaving, TableHashes
+
+
+class SketchAnalyzer(ChunkConsumer):
+    """Approximate distinct readers and heavy hitters in fixed memory
+
+    Keeps HyperLogLog counts of the distinct readers of each document and
+    of the distinct visitors from each country, Space-Saving summaries of
+    the most read documents and most used user agents, and a Count-Min
+    sketch of the reads of any document. Memory does not grow with the
+    number of events, and analyzers fed different partitions of a stream
+    (in other processes too) merge into the analyzer of the whole stream.
+    """
+    
+    COLUMNS = ('doc', 'country', 'visitor', 'useragent', 'event_type')
+    # Reads are selected per sketch
+    EVENT_TYPES = None
+    
+    def __init__(self, data=None, precision=10, top_k=100, width=2048, depth=4, window=None):
+        super().__init__(window)
+        self.hashes = TableHashes()
+        self.document_readers = KeyedHyperLogLog(precision)
+        self.country_visitors = KeyedHyperLogLog(precision)
+        self.top_documents = SpaceSaving(top_k)
+        self.top_useragents = SpaceSaving(top_k)
+        self.document_reads = CountMinSketch(width, depth)
+        
+        if data is not None:
+            self.consume(data)
+    
+    def consume_chunk(self, chunk):
+        visitor, country = chunk.columns['visitor'], chunk.columns['country']
+        
+        has_country = (visitor != 0) & (country != 0)
+        self.country_visitors.add(country[has_country], self.tables['country'],
+                                  self.hashes(visitor[has_country], self.tables['visitor']))
+        self.top_useragents.add(chunk.columns['useragent'], self.tables['useragent'])
+        
+        # Reads as counted by the also-likes indices
+        reads = chunk.select(('doc', 'visitor'), RecommendationAnalyzer.EVENT_TYPES).columns
+        doc = reads['doc']
+        self.top_documents.add(doc, self.tables['doc'])
+        self.document_reads.add(self.hashes(doc[doc != 0], self.tables['doc']))
+        has_reader = (doc != 0) & (reads['visitor'] != 0)
+        self.document_readers.add(doc[has_reader], self.tables['doc'],
+                                  self.hashes(reads['visitor'][has_reader], self.tables['visitor']))
+    
+    def get_unique_readers(self, doc_uuid):
+        """Estimated number of distinct visitors who read a document"""
+        return self.document_readers.count(doc_uuid)
+    
+    def get_unique_visitors_by_country(self):
+        return self.country_visitors.counts()
+    
+    def get_top_documents(self, n=10):
+        """The n most read documents, as (doc_uuid, estimated reads) pairs"""
+        return self.top_documents.top(n)
+    
+    def get_top_useragents(self, n=10):
+        """The n most used user agents, as (useragent, estimated views) pairs"""
+        return self.top_useragents.top(n)
+    
+    def get_document_reads(self, doc_uuid):
+        """Estimated reads of any document (never below the true count)"""
+        return self.document_reads.count(doc_uuid)
+    
+    def print_summary(self, doc_uuid=None, n=10):
+        """Print the approximate counts, with the distinct readers of doc_uuid if given"""
+        print(f"\n{'='*80}")
+        print(f"Approximate counts ({self.nbytes():,} bytes of sketches)")
+        print(f"{'='*80}")
+        if doc_uuid:
+            print(f"Distinct readers of {doc_uuid}: ~{self.get_unique_readers(doc_uuid):,} "
+                  f"(~{self.get_document_reads(doc_uuid):,} reads)")
+        print(f"Top {n} documents by reads:")
+        for rank, (doc, reads) in enumerate(self.get_top_documents(n), 1):
+            print(f"  {rank:>3}. {doc:<50} ~{reads:,}")
+        print(f"Top {n} user agents by views:")
+        for rank, (useragent, views) in enumerate(self.get_top_useragents(n), 1):
+            print(f"  {rank:>3}. {useragent[:60]:<60} ~{views:,}")
+        print("Distinct visitors by country:")
+        countries = sorted(self.get_unique_visitors_by_country().items(), key=lambda x: x[1], reverse=True)
+        for country, visitors in countries[:n]:
+            print(f"  {country:20s}: ~{visitors:,}")
+        print(f"{'='*80}\n")
+    
+    def merge(self, other):
+        """Add the sketches of another SketchAnalyzer, e.g. fed another partition"""
+        self.document_readers.merge(other.document_readers)
+        self.country_visitors.merge(other.country_visitors)
+        self.top_documents.merge(other.top_documents)
+        self.top_useragents.merge(other.top_useragents)
+        self.document_reads.merge(other.document_reads)
+    
+    def nbytes(self):
+        return (self.document_readers.nbytes() + self.country_visitors.nbytes()
+                + self.document_reads.nbytes())
@@ -1,18 +1,218 @@
-import json
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Iterator, Iterable, Optional, Callable, Tuple
+
+from data.event_store import EventStore, StringTable, iter_chunks, new_tables, DEFAULT_CHUNK_SIZE
+from data.snapshot import SnapshotWriter, load_snapshot
+from data.parallel_parser import iter_parallel_chunks
+from data.decoders import get_decoder, event_type_filter
 
 class DataLoader:
-    def __init__(self, file_path: str = None):
-        from config import DEFAULT_DATA_FILE
+    def __init__(self, file_path: str = None, batch_size: int = 10000,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, use_cache: bool = True,
+                 cache_dir: str = None, use_mmap: bool = True, workers: int = 1,
+                 decoder: str = 'auto', columns: Iterable[str] = None,
+                 event_types: Iterable[str] = None, window: Tuple[Optional[int], Optional[int]] = None):
+        from config import DEFAULT_DATA_FILE, CACHE_DIR
         self.file_path = file_path or DEFAULT_DATA_FILE
-    
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.use_mmap = use_mmap
+        self.workers = workers
+        self.decoder = get_decoder(decoder)
+        # Columns to extract when parsing, None for every column in SCHEMA
+        self.columns = columns
+        # Event types to keep when parsing, None for every event
+        self.event_types = event_types
+        # [start, end) range of timestamps to keep, None (or None ends) for no limit
+        self.window = window
+        self.last_error = None
+        self.last_stats = None
+        # Byte offset just past the last record read by iter_tail_chunks
+        self.offset = 0
+
+    def _read_records(self, materialise: bool = True,
+                      event_types: Iterable[str] = None) -> Iterator[Any]:
+        # Lines are handed to the decoder as bytes, which every backend accepts
+        loads = self.decoder.loads_dict if materialise else self.decoder.loads
+        keep = event_type_filter(event_types)
+        with open(self.file_path, 'rb') as file:
+            for line in file:
+                if line.strip() and (keep is None or keep(line)):
+                    yield loads(line)
+
+    def _read_records_from(self, offset: int) -> Iterator[Any]:
+        """Records from byte `offset` on, advancing self.offset past each complete line
+
+        A last line without a newline may still be being written; it is only
+        consumed if it already decodes, otherwise the next read retries it.
+        """
+        loads = self.decoder.loads
+        with open(self.file_path, 'rb') as file:
+            file.seek(offset)
+            self.offset = offset
+            for line in file:
+                if not line.endswith(b'\n'):
+                    try:
+                        record = loads(line) if line.strip() else None
+                    except ValueError:
+                        return
+                    self.offset += len(line)
+                    if record is not None:
+                        yield record
+                    return
+                self.offset += len(line)
+                if line.strip():
+                    yield loads(line)
+
+    def _track(self, items: Iterator, action: str, count_of: Callable = None,
+               workers: int = 1, report: bool = True) -> Iterator:
+        """Pass items through, reporting the record count, throughput and any error"""
+        count = 0
+        self.last_error = None
+        started = time.perf_counter()
+        try:
+            for item in items:
+                count += count_of(item) if count_of else 1
+                yield item
+        except FileNotFoundError as e:
+            self.last_error = e
+            print(f"Error: Data file not found at {self.file_path}")
+            return
+        except Exception as e:
+            self.last_error = e
+            print(f"Error loading data after {count} records: {e}")
+            return
+
+        seconds = time.perf_counter() - started
+        rate = count / seconds if seconds > 0 else 0.0
+        self.last_stats = {'records': count, 'seconds': seconds, 'records_per_second': rate,
+                           'decoder': self.decoder.name, 'workers': workers}
+        if not report:
+            return
+        details = f"{rate:,.0f} records/s, {self.decoder.name} decoder"
+        if workers > 1:
+            details += f", {workers} workers"
+        print(f"{action} {count} records from {self.file_path} in {seconds:.2f}s ({details})")
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Lazily yield records one at a time, holding a single line in memory"""
+        return self._track(self._read_records(), "Streamed")
+
+    def iter_batches(self, batch_size: int = None) -> Iterator[List[Dict[str, Any]]]:
+        """Lazily yield lists of at most batch_size records"""
+        batch_size = batch_size or self.batch_size
+        batch = []
+        for record in self.iter_records():
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _load_snapshot(self, tables: Dict[str, StringTable] = None) -> Optional[EventStore]:
+        """Columnar snapshot of the file written by an earlier run, if still current"""
+        if not self.use_cache:
+            return None
+        # A snapshot's codes can only be reused by tables that are still empty
+        if tables is not None and any(len(table) > 1 for table in tables.values()):
+            return None
+
+        store = load_snapshot(self.file_path, self.cache_dir, self.use_mmap)
+        if store is None:
+            return None
+        if tables is not None:
+            for name, table in tables.items():
+                for value in store.tables[name].values[1:]:
+                    table.encode(value)
+            store.tables = tables
+        print(f"Loaded snapshot of {len(store)} records for {self.file_path}")
+        return store
+
+    def _snapshot_writer(self) -> Optional[SnapshotWriter]:
+        if not self.use_cache:
+            return None
+        try:
+            return SnapshotWriter(self.file_path, self.cache_dir)
+        except OSError:
+            return None
+
+    def _iter_parsed_chunks(self, tables: Dict[str, StringTable], columns: Iterable[str] = None,
+                            event_types: Iterable[str] = None) -> Iterator[EventStore]:
+        if self.workers <= 1:
+            # The builder only looks up projected fields, so lazy decoders
+            # never materialise the rest of the record
+            records = self._track(self._read_records(False, event_types), "Parsed")
+            return iter_chunks(records, tables, self.chunk_size, columns)
+
+        chunks = iter_parallel_chunks(self.file_path, tables, self.workers,
+                                      self.decoder.name, columns, event_types)
+        return self._track(chunks, "Parsed", len, self.workers)
+
+    def iter_chunks(self, tables: Dict[str, StringTable] = None) -> Iterator[EventStore]:
+        """Lazily yield columnar chunks sharing one set of string tables
+
+        The chunks come from the file's snapshot when there is one. Otherwise the
+        file is parsed, serially or on `workers` processes, and a snapshot is
+        written alongside for the next run. With a `window` only the events
+        in [start, end) are yielded. Both parse paths produce the same
+        rows and codes. When `columns` is set and caching is off, a parse only
+        extracts those columns and skips events not in `event_types` before
+        decoding them; otherwise chunks carry every column and event.
+        """
+        store = self._load_snapshot(tables)
+        if store is not None:
+            if self.window is not None:
+                # Binary search in the snapshot's timestamp index, only the
+                # rows inside the window are read
+                store = store.window(*self.window)
+            # Slices of a memory-mapped store are views, nothing is copied
+            for start in range(0, len(store), self.chunk_size):
+                yield store.take(slice(start, start + self.chunk_size))
+            return
+
+        tables = tables if tables is not None else new_tables()
+        writer = self._snapshot_writer()
+        # A snapshot has to serve every task, so only uncached parses are projected
+        columns = self.columns if writer is None else None
+        event_types = self.event_types if writer is None else None
+        completed = False
+        try:
+            for chunk in self._iter_parsed_chunks(tables, columns, event_types):
+                if writer is not None:
+                    writer.append(chunk)
+                yield chunk.of_window(self.window)
+            completed = self.last_error is None
+        finally:
+            if writer is not None:
+                if completed:
+                    writer.commit(tables)
+                else:
+                    writer.abort()
+
+    def iter_tail_chunks(self, offset: int = 0, tables: Dict[str, StringTable] = None,
+                         report: bool = True) -> Iterator[EventStore]:
+        """Lazily yield columnar chunks of the records appended after byte `offset`
+
+        Used to bring incremental state up to date; afterwards self.offset is
+        where the next call should resume. Tail reads bypass the snapshot.
+        """
+        tables = tables if tables is not None else new_tables()
+        records = self._track(self._read_records_from(offset), "Parsed new", report=report)
+        return iter_chunks(records, tables, self.chunk_size, self.columns)
+
+    def load_store(self) -> EventStore:
+        """Load the whole file into a single columnar EventStore"""
+        store = self._load_snapshot()
+        if store is not None:
+            return store.window(*self.window) if self.window is not None else store
+        return EventStore.concat(list(self.iter_chunks()))
+
     def load_data(self) -> List[Dict[str, Any]]:
-        data = []
         try:
-            with open(self.file_path, 'r', encoding='utf-8') as file:
-                for line in file:
-                    if line.strip():
-                        data.append(json.loads(line))
+            data = list(self._read_records())
             print(f"Loaded {len(data)} records from {self.file_path}")
             return data
         except FileNotFoundError:
@@ -0,0 +1,91 @@
+import json
+import re
+from typing import Callable, Dict, Iterable, Optional
+
+# Backends tried, in order, when the decoder is 'auto'
+PREFERRED_DECODERS = ['orjson', 'simdjson', 'json']
+
+
+class Decoder:
+    """A JSON-lines decoder backend
+
+    `loads` turns one line (bytes) into a record that supports `get`. Lazy
+    backends only materialise the fields that are looked up, `to_dict`
+    turns such a record into a plain dict when the caller needs one.
+    """
+
+    def __init__(self, name: str, loads: Callable, to_dict: Callable = None):
+        self.name = name
+        self.loads = loads
+        self.to_dict = to_dict
+
+    def loads_dict(self, line: bytes) -> Dict:
+        record = self.loads(line)
+        return self.to_dict(record) if self.to_dict else record
+
+
+def _orjson_decoder() -> Decoder:
+    import orjson
+    return Decoder('orjson', orjson.loads)
+
+
+def _simdjson_decoder() -> Decoder:
+    import simdjson
+    # A parser cannot parse again while a document it returned is alive, and
+    # the loaders still hold the previous record when they read the next
+    # line, so every line gets its own (cheap) parser
+    return Decoder('simdjson', lambda line: simdjson.Parser().parse(line),
+                   lambda record: record.as_dict())
+
+
+def _json_decoder() -> Decoder:
+    return Decoder('json', json.loads)
+
+
+DECODERS = {
+    'orjson': _orjson_decoder,
+    'simdjson': _simdjson_decoder,
+    'json': _json_decoder,
+}
+
+
+def get_decoder(name: str = 'auto') -> Decoder:
+    """Decoder for a backend name, 'auto' picks the fastest one installed
+
+    A backend that is not installed falls back to the standard library.
+    """
+    if name != 'auto':
+        if name not in DECODERS:
+            raise ValueError(f"Unknown JSON decoder '{name}', expected one of {list(DECODERS)}")
+        try:
+            return DECODERS[name]()
+        except ImportError:
+            print(f"Warning: JSON decoder '{name}' is not installed, using json")
+            return _json_decoder()
+
+    for candidate in PREFERRED_DECODERS:
+        try:
+            return DECODERS[candidate]()
+        except ImportError:
+            continue
+    return _json_decoder()
+
+
+_EVENT_TYPE = re.compile(rb'"event_type"\s*:\s*"([^"]*)"')
+
+
+def event_type_filter(event_types: Optional[Iterable[str]]) -> Optional[Callable[[bytes], bool]]:
+    """Predicate keeping the raw lines of the given event types, None to keep every line
+
+    The type is found with a regular expression before the line is decoded,
+    so unwanted events never pay for JSON parsing. Lines whose type cannot
+    be found are kept and left to the analyzers.
+    """
+    if event_types is None:
+        return None
+    wanted = {name.encode('utf-8') for name in event_types}
+
+    def keep(line: bytes) -> bool:
+        match = _EVENT_TYPE.search(line)
+        return match is None or match.group(1) in wanted
+    return keep
@@ -0,0 +1,391 @@
+from array import array
+from collections.abc import Set
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import sys
+import os
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from models.document_view import DocumentView
+from utils.country_mapper import CountryMapper
+
+# Columns kept from each issuu record. Encoded columns store integer codes
+# into a StringTable, the others store the numeric value itself.
+#   column name: (record key, array typecode, dictionary encoded)
+SCHEMA = {
+    'doc': ('env_doc_id', 'i', True),
+    'visitor': ('visitor_uuid', 'i', True),
+    'country': ('visitor_country', 'h', True),
+    'continent': ('visitor_continent', 'h', True),
+    'useragent': ('visitor_useragent', 'i', True),
+    'readtime': ('event_readtime', 'q', False),
+    'ts': ('ts', 'q', False),
+    'event_type': ('event_type', 'b', True),
+}
+
+ENCODED_COLUMNS = [name for name, (_, _, encoded) in SCHEMA.items() if encoded]
+
+DEFAULT_CHUNK_SIZE = 100000
+
+
+class StringTable:
+    """Dictionary encoding of strings to dense integer codes (0 is the empty string)"""
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: List[str] = ['']
+        self.codes: Dict[str, int] = {'': 0}
+        for value in values:
+            self.encode(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value) -> int:
+        if not value:
+            return 0
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value) -> Optional[int]:
+        """Code of an existing value, None if it was never seen"""
+        return self.codes.get(value) if value else None
+
+    def decode(self, code: int) -> str:
+        return self.values[code]
+
+    def encode_many(self, values: Iterable[str]) -> List[int]:
+        return [self.encode(value) for value in values]
+
+
+class CodeMap:
+    """Per-code values of other string tables, e.g. their codes in this structure's own table
+
+    `compute` turns a list of strings into their values (codes in another
+    table, hashes...). Each source table gets an array indexed by its codes,
+    extended as the table grows, so every distinct string is computed once
+    however many events carry it. Sources are matched by identity, which
+    does not survive pickling, so the arrays are not pickled.
+    """
+
+    def __init__(self, compute: Callable[[List[str]], Iterable], dtype=np.int64):
+        self.compute = compute
+        self.dtype = dtype
+        self._maps: Dict[int, Tuple[StringTable, np.ndarray]] = {}
+
+    def __call__(self, codes: np.ndarray, source: StringTable) -> np.ndarray:
+        cached = self._maps.get(id(source))
+        mapping = cached[1] if cached is not None and cached[0] is source else np.zeros(0, dtype=self.dtype)
+        if len(mapping) < len(source):
+            new = np.asarray(self.compute(source.values[len(mapping):]), dtype=self.dtype)
+            mapping = np.concatenate([mapping, new])
+            self._maps[id(source)] = (source, mapping)
+        return mapping[codes]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = {}
+        return state
+
+
+class CodeSet(Set):
+    """Read-only set of the strings behind sorted unique codes, decoded lazily
+
+    Wraps a view of an index's code array (e.g. one CSR row) and its string
+    table, so returning it copies nothing; `codes` gives the array itself.
+    """
+
+    __slots__ = ('codes', 'table')
+
+    def __init__(self, codes: np.ndarray, table: StringTable):
+        self.codes = codes
+        self.table = table
+
+    @classmethod
+    def _from_iterable(cls, values):
+        # Results of set operators are plain sets
+        return set(values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self) -> Iterator[str]:
+        values = self.table.values
+        return (values[code] for code in self.codes.tolist())
+
+    def __contains__(self, value) -> bool:
+        code = self.table.lookup(value)
+        if code is None:
+            return False
+        position = np.searchsorted(self.codes, code)
+        return position < len(self.codes) and self.codes[position] == code
+
+    def __repr__(self):
+        return f"CodeSet({set(self)!r})"
+
+    def intersection(self, other) -> set:
+        return self & set(other)
+
+
+def new_tables() -> Dict[str, StringTable]:
+    return {name: StringTable() for name in ENCODED_COLUMNS}
+
+
+def grow(array: np.ndarray, length: int) -> np.ndarray:
+    """The array with at least `length` rows, the new ones zero
+
+    Grows geometrically so small appended chunks (follow mode) do not copy
+    the whole array every time; arrays indexed by code may therefore be
+    longer than their string table.
+    """
+    if len(array) >= length:
+        return array
+    grown = np.zeros((max(length, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def timestamp_order(ts: np.ndarray) -> np.ndarray:
+    """Row numbers sorting a timestamp column (stable, so equal timestamps keep file order)"""
+    if len(ts) < 2 or bool(np.all(ts[1:] >= ts[:-1])):
+        # Logs are usually appended in time order
+        return np.arange(len(ts), dtype=np.int64)
+    return np.argsort(ts, kind='stable').astype(np.int64)
+
+
+def in_window(ts: np.ndarray, window) -> np.ndarray:
+    """Mask of the timestamps inside a [start, end) window (None leaves that side open)"""
+    start, end = window
+    mask = np.ones(len(ts), dtype=bool)
+    if start is not None:
+        mask &= ts >= start
+    if end is not None:
+        mask &= ts < end
+    return mask
+
+
+class EventStore:
+    """Column oriented storage of the event fields the analyzers use"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], tables: Dict[str, StringTable],
+                 ts_order: np.ndarray = None):
+        self.columns = columns
+        self.tables = tables
+        # Row numbers in timestamp order, built on the first window query
+        self.ts_order = ts_order
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def __getitem__(self, row: int) -> DocumentView:
+        return DocumentView(self, row)
+
+    def __iter__(self) -> Iterator[DocumentView]:
+        for row in range(len(self)):
+            yield DocumentView(self, row)
+
+    def code(self, column: str, value) -> Optional[int]:
+        return self.tables[column].lookup(value)
+
+    def decode(self, column: str, code: int) -> str:
+        return self.tables[column].values[code]
+
+    def _column_for(self, column: str, purpose: str) -> np.ndarray:
+        """A column a filter needs: missing, the filter would silently keep every row"""
+        if column not in self.columns:
+            raise ValueError(f"Cannot filter by {purpose}: the store has no '{column}' column "
+                             f"(it was parsed with columns {list(self.columns)})")
+        return self.columns[column]
+
+    def of_window(self, window) -> 'EventStore':
+        """Store of the events inside a [start, end) window, scanning the ts column"""
+        if window is None:
+            return self
+        return self.take(in_window(self._column_for('ts', 'time window'), window))
+
+    def select(self, columns: Iterable[str], event_types: Optional[Iterable[str]] = None,
+               window=None) -> 'EventStore':
+        """Store of the given columns of the events of the given types inside a window
+
+        The event type and [start, end) window filters (None for no filter)
+        are combined into one mask that only the selected columns are copied
+        through; without filters the columns are the store's own arrays.
+        """
+        rows = None
+        if event_types is not None:
+            codes = [code for code in (self.code('event_type', name) for name in event_types)
+                     if code is not None]
+            rows = np.isin(self._column_for('event_type', 'event type'), codes)
+        if window is not None:
+            in_ts = in_window(self._column_for('ts', 'time window'), window)
+            rows = in_ts if rows is None else rows & in_ts
+        if rows is None:
+            return EventStore({name: self.columns[name] for name in columns}, self.tables)
+        return EventStore({name: self.columns[name][rows] for name in columns}, self.tables)
+
+    def sorted_ts(self):
+        """(row order, timestamps in that order) of the timestamp-sorted index"""
+        ts = self._column_for('ts', 'time window')
+        if self.ts_order is None:
+            self.ts_order = timestamp_order(ts)
+        return self.ts_order, ts[self.ts_order]
+
+    def window_rows(self, start: Optional[int] = None, end: Optional[int] = None):
+        """Rows with start <= ts < end, in file order: a slice when ts is already sorted"""
+        order, ts = self.sorted_ts()
+        first = 0 if start is None else int(np.searchsorted(ts, start, side='left'))
+        last = len(ts) if end is None else int(np.searchsorted(ts, end, side='left'))
+        last = max(first, last)
+        if len(order) and order[0] == 0 and order[-1] == len(order) - 1 \
+                and np.array_equal(order[first:last], np.arange(first, last)):
+            return slice(first, last)
+        return np.sort(order[first:last])
+
+    def window(self, start: Optional[int] = None, end: Optional[int] = None) -> 'EventStore':
+        """Store of the events with start <= ts < end (None leaves that side open)
+
+        Only the matching rows are read: their range is found by binary search
+        in the timestamp-sorted index.
+        """
+        if start is None and end is None:
+            return self
+        return self.take(self.window_rows(start, end))
+
+    def take(self, rows) -> 'EventStore':
+        """Store of the selected rows (slice, mask or index array), sharing the tables"""
+        return EventStore({name: col[rows] for name, col in self.columns.items()}, self.tables)
+
+    @staticmethod
+    def concat(chunks: List['EventStore']) -> 'EventStore':
+        if not chunks:
+            return EventStoreBuilder().build()
+        tables = chunks[0].tables
+        if any(chunk.tables is not tables for chunk in chunks):
+            raise ValueError("Cannot concatenate chunks encoded with different string tables")
+        columns = {name: np.concatenate([chunk.columns[name] for chunk in chunks])
+                   for name in chunks[0].columns}
+        return EventStore(columns, tables)
+
+    def nbytes(self) -> int:
+        return sum(col.nbytes for col in self.columns.values())
+
+
+class EventStoreBuilder:
+    """Appends records into growable array buffers and freezes them into EventStores
+
+    Only the requested columns are extracted (all of SCHEMA by default), so
+    fields no task needs are never looked up or encoded.
+    """
+
+    def __init__(self, tables: Dict[str, StringTable] = None, columns: Iterable[str] = None):
+        self.tables = tables if tables is not None else new_tables()
+        self.columns = [name for name in SCHEMA if columns is None or name in columns]
+        if not self.columns:
+            raise ValueError(f"No known columns requested, expected some of {list(SCHEMA)}")
+        self.country_mapper = CountryMapper()
+        self._reset()
+
+    def _reset(self):
+        self._buffers = {name: array(SCHEMA[name][1]) for name in self.columns}
+        self._appenders = [self._column_appender(name) for name in self.columns]
+
+    def _column_appender(self, name: str):
+        """Function extracting one column's value from a record into its buffer"""
+        key, _, encoded = SCHEMA[name]
+        append = self._buffers[name].append
+
+        if name == 'continent':
+            encode = self.tables[name].encode
+            get_continent = self.country_mapper.get_continent
+
+            def append_continent(record):
+                # Use the continent from data if available, otherwise map from country code
+                continent = record.get(key)
+                if not continent:
+                    continent = get_continent(record.get('visitor_country'))
+                append(encode(continent))
+            return append_continent
+
+        if encoded:
+            encode = self.tables[name].encode
+            return lambda record: append(encode(record.get(key)))
+
+        def append_number(record):
+            # Non numeric or negative values (e.g. read times) count as 0
+            try:
+                value = int(record.get(key) or 0)
+            except (ValueError, TypeError):
+                value = 0
+            append(value if value > 0 else 0)
+        return append_number
+
+    def __len__(self):
+        return len(self._buffers[self.columns[0]])
+
+    def append(self, record: Dict):
+        for append_column in self._appenders:
+            append_column(record)
+
+    def extend(self, records: Iterable[Dict]):
+        for record in records:
+            self.append(record)
+
+    def build(self) -> EventStore:
+        """Freeze the buffered rows into an EventStore and start a new chunk"""
+        columns = {name: np.frombuffer(buffer, dtype=buffer.typecode) if len(buffer)
+                   else np.zeros(0, dtype=buffer.typecode)
+                   for name, buffer in self._buffers.items()}
+        self._reset()
+        return EventStore(columns, self.tables)
+
+
+class ChunkConsumer:
+    """Base of the analyzers that fold event store chunks into running totals
+
+    Subclasses declare the COLUMNS they read and the EVENT_TYPES they count
+    (None for all) and implement consume_chunk, which is passed each chunk
+    already reduced to those columns and to the events inside the window.
+    """
+
+    # Event store columns read by the analyzer
+    COLUMNS: Tuple[str, ...] = ()
+    # Event types read by the analyzer, None for all
+    EVENT_TYPES: Optional[Tuple[str, ...]] = None
+
+    def __init__(self, window: Tuple[Optional[int], Optional[int]] = None):
+        # Only events with window[0] <= ts < window[1] are counted, None for all
+        self.window = window
+        self.tables = None
+
+    def consume(self, data):
+        """Update the analyzer from an EventStore, a stream of chunks or of records"""
+        for chunk in iter_chunks(data, self.tables):
+            self.tables = chunk.tables
+            self.consume_chunk(chunk.select(self.COLUMNS, self.EVENT_TYPES, self.window))
+
+    def consume_chunk(self, chunk: EventStore):
+        raise NotImplementedError
+
+
+def iter_chunks(data, tables: Dict[str, StringTable] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE, columns: Iterable[str] = None) -> Iterator[EventStore]:
+    """Normalise analyzer input (an EventStore, a stream of EventStores or of records) to chunks"""
+    if isinstance(data, EventStore):
+        yield data
+        return
+
+    builder = None
+    for item in data:
+        if isinstance(item, EventStore):
+            yield item
+            continue
+        if builder is None:
+            builder = EventStoreBuilder(tables, columns)
+        builder.append(item)
+        if len(builder) >= chunk_size:
+            yield builder.build()
+    if builder is not None and len(builder):
+        yield builder.build()
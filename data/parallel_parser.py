@@ -0,0 +1,98 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple
+import numpy as np
+
+from data.event_store import EventStore, EventStoreBuilder, StringTable
+from data.decoders import get_decoder, event_type_filter
+
+# Target size of the byte range handed to one worker
+RANGE_BYTES = 32 * 1024 * 1024
+
+
+def split_ranges(file_path: str, parts: int) -> List[Tuple[int, int]]:
+    """Split a file into at most `parts` byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+    parts = max(1, min(parts, size))
+    boundaries = [0]
+    with open(file_path, 'rb') as file:
+        for i in range(1, parts):
+            file.seek(max(size * i // parts, boundaries[-1]))
+            # Move to the start of the next line, so no line is split
+            file.readline()
+            position = file.tell()
+            if position >= size:
+                break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_range(file_path: str, start: int, end: int, decoder_name: str = 'auto',
+                columns: List[str] = None, event_types: List[str] = None):
+    """Worker: parse one byte range into columns encoded against range-local tables"""
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    loads = get_decoder(decoder_name).loads
+    keep = event_type_filter(event_types)
+    builder = EventStoreBuilder(columns=columns)
+    for line in data.split(b'\n'):
+        if line.strip() and (keep is None or keep(line)):
+            builder.append(loads(line))
+    chunk = builder.build()
+    # Plain lists and arrays pickle much faster than the StringTable dicts
+    return chunk.columns, {name: table.values for name, table in builder.tables.items()}
+
+
+def merge_chunk(columns: Dict[str, np.ndarray], local_values: Dict[str, List[str]],
+                tables: Dict[str, StringTable]) -> EventStore:
+    """Re-encode a worker chunk against the shared tables
+
+    Chunks are merged in file order and each local table lists its values in
+    order of first appearance, so the shared codes come out exactly as the
+    serial loader would assign them.
+    """
+    columns = dict(columns)
+    for name in local_values:
+        if name not in columns:
+            continue
+        table = tables[name]
+        mapping = np.fromiter((table.encode(value) for value in local_values[name]),
+                              dtype=np.int64, count=len(local_values[name]))
+        columns[name] = mapping[columns[name]].astype(columns[name].dtype)
+    return EventStore(columns, tables)
+
+
+def iter_parallel_chunks(file_path: str, tables: Dict[str, StringTable], workers: int,
+                         decoder_name: str = 'auto',
+                         columns: Iterable[str] = None,
+                         event_types: Iterable[str] = None) -> Iterator[EventStore]:
+    """Parse a JSON-lines file on `workers` processes, yielding chunks in file order"""
+    parts = max(workers * 4, os.path.getsize(file_path) // RANGE_BYTES + 1)
+    ranges = split_ranges(file_path, parts)
+    columns = list(columns) if columns is not None else None
+    event_types = list(event_types) if event_types is not None else None
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Keep a bounded number of ranges in flight so finished chunks
+        # cannot pile up in memory faster than they are consumed
+        pending = deque()
+        next_range = 0
+        try:
+            while next_range < len(ranges) or pending:
+                while next_range < len(ranges) and len(pending) < workers * 2:
+                    start, end = ranges[next_range]
+                    pending.append(executor.submit(parse_range, file_path, start, end,
+                                                   decoder_name, columns, event_types))
+                    next_range += 1
+                chunk_columns, local_values = pending.popleft().result()
+                yield merge_chunk(chunk_columns, local_values, tables)
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, Optional
+import numpy as np
+
+from data.event_store import EventStore, StringTable, SCHEMA, timestamp_order
+
+# Bump whenever SCHEMA or the on-disk layout changes so old snapshots are ignored
+FORMAT_VERSION = 2
+
+
+def _source_key(source_path: str):
+    """Snapshot directory prefix for the file and key for its current contents"""
+    path = os.path.abspath(source_path)
+    stat = os.stat(path)
+    path_hash = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+    content_key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}|v{FORMAT_VERSION}"
+    content_hash = hashlib.sha1(content_key.encode('utf-8')).hexdigest()[:16]
+    return path_hash, f"{path_hash}-{content_hash}"
+
+
+def snapshot_dir(source_path: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, _source_key(source_path)[1])
+
+
+def _open_column(path: str, typecode: str, rows: int, mmap: bool) -> np.ndarray:
+    if not mmap:
+        return np.fromfile(path, dtype=typecode)
+    if rows == 0:
+        # mmap cannot map an empty file
+        return np.zeros(0, dtype=typecode)
+    # Read-only mapping: pages come from the OS page cache and are shared
+    # between every process that opens the same snapshot
+    return np.memmap(path, dtype=typecode, mode='r', shape=(rows,))
+
+
+def _read_snapshot(directory: str, mmap: bool) -> Optional[EventStore]:
+    meta_file = os.path.join(directory, 'meta.json')
+    if not os.path.exists(meta_file):
+        return None
+
+    with open(meta_file, 'r', encoding='utf-8') as file:
+        meta = json.load(file)
+    if meta.get('version') != FORMAT_VERSION:
+        return None
+
+    with open(os.path.join(directory, 'tables.json'), 'r', encoding='utf-8') as file:
+        tables = {name: StringTable(values) for name, values in json.load(file).items()}
+
+    columns = {}
+    rows = meta['rows']
+    for name, (_, typecode, _) in SCHEMA.items():
+        path = os.path.join(directory, f"{name}.bin")
+        if os.path.getsize(path) != rows * np.dtype(typecode).itemsize:
+            return None
+        columns[name] = _open_column(path, typecode, rows, mmap)
+
+    ts_order = None
+    order_path = os.path.join(directory, 'ts_order.bin')
+    if os.path.exists(order_path) and os.path.getsize(order_path) == rows * 8:
+        ts_order = _open_column(order_path, 'q', rows, mmap)
+    return EventStore(columns, tables, ts_order)
+
+
+def load_snapshot(source_path: str, cache_dir: str, mmap: bool = True) -> Optional[EventStore]:
+    """Load the snapshot of source_path, None if it is missing, out of date or unreadable
+
+    With mmap the columns are zero-copy views of the snapshot files rather
+    than arrays read into the heap.
+    """
+    try:
+        return _read_snapshot(snapshot_dir(source_path, cache_dir), mmap)
+    except (OSError, ValueError):
+        # Removed by another process's commit mid-read, truncated or corrupt
+        return None
+
+
+class SnapshotWriter:
+    """Appends chunks to raw column files and publishes them atomically on commit"""
+
+    def __init__(self, source_path: str, cache_dir: str):
+        self.source_path = source_path
+        self.cache_dir = cache_dir
+        self.path_hash, self.name = _source_key(source_path)
+        self.tmp_dir = os.path.join(cache_dir, f".{self.name}.{os.getpid()}.tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.files = {name: open(os.path.join(self.tmp_dir, f"{name}.bin"), 'wb')
+                      for name in SCHEMA}
+        self.rows = 0
+
+    def append(self, chunk: EventStore):
+        for name, file in self.files.items():
+            chunk.columns[name].astype(SCHEMA[name][1], copy=False).tofile(file)
+        self.rows += len(chunk)
+
+    def _close(self):
+        for file in self.files.values():
+            file.close()
+
+    def commit(self, tables: Dict[str, StringTable]):
+        self._close()
+        # Timestamp-sorted row index for window queries
+        ts = np.fromfile(os.path.join(self.tmp_dir, 'ts.bin'), dtype=SCHEMA['ts'][1])
+        timestamp_order(ts).tofile(os.path.join(self.tmp_dir, 'ts_order.bin'))
+        with open(os.path.join(self.tmp_dir, 'tables.json'), 'w', encoding='utf-8') as file:
+            # Code 0 is always the empty string, so it is not stored
+            json.dump({name: table.values[1:] for name, table in tables.items()}, file)
+        with open(os.path.join(self.tmp_dir, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump({'version': FORMAT_VERSION, 'source': os.path.abspath(self.source_path),
+                       'rows': self.rows}, file)
+
+        # Drop snapshots of older versions of the same file, then publish this one
+        target = os.path.join(self.cache_dir, self.name)
+        for entry in os.listdir(self.cache_dir):
+            if entry.startswith(self.path_hash + '-') and entry != self.name:
+                shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+        try:
+            os.replace(self.tmp_dir, target)
+        except OSError:
+            # Another process published a snapshot of the same contents first
+            if not os.path.isdir(target):
+                raise
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def abort(self):
+        self._close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import pickle
+from typing import Any, Dict
+
+# Bump whenever the pickled analyzer state changes shape so old states are ignored
+STATE_VERSION = 3
+
+# Leading bytes of the source fingerprinted to detect a rewritten or rotated file
+FINGERPRINT_BYTES = 4096
+
+
+def state_path(source_path: str, cache_dir: str) -> str:
+    path_hash = hashlib.sha1(os.path.abspath(source_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f"state-{path_hash}.pkl")
+
+
+def _fingerprint(source_path: str, offset: int) -> str:
+    with open(source_path, 'rb') as file:
+        head = file.read(min(offset, FINGERPRINT_BYTES))
+    return hashlib.sha1(head).hexdigest()
+
+
+def save_state(source_path: str, cache_dir: str, offset: int, state: Dict[str, Any]):
+    """Persist analyzer state covering source_path up to byte `offset`
+
+    The state is pickled in one piece, so objects shared between analyzers
+    (the string tables) stay shared when it is loaded back.
+    """
+    path = state_path(source_path, cache_dir)
+    payload = {'version': STATE_VERSION, 'source': os.path.abspath(source_path),
+               'offset': offset, 'fingerprint': _fingerprint(source_path, offset),
+               'state': state}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        pickle.dump(payload, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_state(source_path: str, cache_dir: str):
+    """(offset, state) saved for source_path, None if missing or no longer a prefix of the file
+
+    A file that shrank below the saved offset or whose leading bytes changed
+    was rewritten rather than appended to, so its state cannot be resumed.
+    """
+    path = state_path(source_path, cache_dir)
+    try:
+        with open(path, 'rb') as file:
+            payload = pickle.load(file)
+        if payload.get('version') != STATE_VERSION:
+            return None
+        offset = payload['offset']
+        if os.path.getsize(source_path) < offset:
+            return None
+        if _fingerprint(source_path, offset) != payload['fingerprint']:
+            return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+        return None
+    return offset, payload['state']
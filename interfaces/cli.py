@@ -1,5 +1,22 @@
 import argparse
 import sys
+from datetime import datetime, timezone
+
+from data.decoders import get_decoder
+
+def parse_time(value):
+    """Epoch seconds from an integer or an ISO 8601 date/time (UTC unless it has an offset)"""
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time '{value}', expected epoch seconds or ISO 8601")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
 
 class CLI:
     def __init__(self, analytics_manager):
@@ -9,19 +26,90 @@ class CLI:
         parser = argparse.ArgumentParser(description='Document Tracker Analytics')
         parser.add_argument('-u', '--user_uuid', help='User UUID')
         parser.add_argument('-d', '--doc_uuid', help='Document UUID')
-        parser.add_argument('-t', '--task_id', required=True, 
+        parser.add_argument('-t', '--task_id', 
                           choices=['2a', '2b', '3a', '3b', '4', '5d', '6', '7'],
                           help='Task ID to execute')
         parser.add_argument('-f', '--file_name', required=True, 
                           help='Input JSON file name')
+        parser.add_argument('--no-cache', action='store_true',
+                          help='Always re-parse the input instead of using its binary snapshot')
+        parser.add_argument('-w', '--workers', type=int, default=1,
+                          help='Number of processes used to parse the input (default: 1)')
+        parser.add_argument('--decoder', default='auto', choices=['auto', 'orjson', 'simdjson', 'json'],
+                          help='JSON decoder backend (default: fastest installed)')
+        parser.add_argument('--incremental', action='store_true',
+                          help='Resume from the saved analyzer state and only consume newly appended events')
+        parser.add_argument('--follow', action='store_true',
+                          help='Keep tailing the input and print live aggregates (task id not needed)')
+        parser.add_argument('--interval', type=float, default=10.0,
+                          help='Seconds between live snapshots in follow mode (default: 10)')
+        parser.add_argument('--checkpoint-interval', type=float, default=300.0,
+                          help='Seconds between saves of the incremental state in follow mode (default: 300)')
+        parser.add_argument('--export', metavar='FILE',
+                          help='Also write each live snapshot to FILE as JSON in follow mode')
+        
+        parser.add_argument('--since', type=parse_time,
+                          help='Only analyse events at or after this time (epoch seconds or ISO date, UTC)')
+        parser.add_argument('--until', type=parse_time,
+                          help='Only analyse events before this time (epoch seconds or ISO date, UTC)')
+        parser.add_argument('--build-also-likes', action='store_true',
+                          help='Precompute and save the top-K also-likes table of every document')
+        parser.add_argument('--top-k', type=int, default=10,
+                          help='Also-likes kept per document by --build-also-likes (default: 10)')
+        parser.add_argument('--min-readers', type=int, default=1,
+                          help='Only precompute documents with at least this many readers (default: 1)')
+        parser.add_argument('--rollups', metavar='DIR',
+                          help='Build hourly and daily rollup cubes of the input and save them to DIR')
+        parser.add_argument('--merge-rollups', action='store_true',
+                          help='Add the cubes already saved in the --rollups directory instead of replacing them')
+        parser.add_argument('--sketches', action='store_true',
+                          help='Print fixed-memory approximate distinct readers and top documents (with -d, of that document)')
         
-        return parser.parse_args()
+        args = parser.parse_args()
+        if (not args.task_id and not args.follow and not args.build_also_likes and not args.rollups
+                and not args.sketches):
+            parser.error('the following arguments are required: -t/--task_id')
+        if (args.since is not None or args.until is not None) and (args.incremental or args.follow):
+            parser.error('--since/--until cannot be combined with --incremental or --follow')
+        if (args.since is not None or args.until is not None) and args.build_also_likes:
+            # The saved table is served for the whole file, not a window of it
+            parser.error('--since/--until cannot be combined with --build-also-likes')
+        if args.rollups and (args.incremental or args.follow):
+            parser.error('--rollups cannot be combined with --incremental or --follow')
+        if args.merge_rollups and not args.rollups:
+            parser.error('--merge-rollups requires --rollups')
+        if args.sketches and (args.incremental or args.follow):
+            parser.error('--sketches cannot be combined with --incremental or --follow')
+        return args
     
     def run(self):
         args = self.parse_arguments()
         
-        self.analytics_manager.data_loader.file_path = args.file_name
-        self.analytics_manager.load_data()
+        self.analytics_manager.data_loader.use_cache = not args.no_cache
+        self.analytics_manager.data_loader.workers = args.workers
+        self.analytics_manager.data_loader.decoder = get_decoder(args.decoder)
+        if args.follow:
+            self.analytics_manager.data_loader.file_path = args.file_name
+            self.analytics_manager.follow(args.interval, doc_uuid=args.doc_uuid,
+                                          export_path=args.export,
+                                          checkpoint_interval=args.checkpoint_interval)
+            return
+        tasks = [args.task_id] if args.task_id else []
+        if args.build_also_likes:
+            tasks.append('5d')
+        window = None
+        if args.since is not None or args.until is not None:
+            window = (args.since, args.until)
+        self.analytics_manager.ingest(args.file_name, tasks=tasks, incremental=args.incremental,
+                                      window=window, rollups=bool(args.rollups), sketches=args.sketches)
+        if args.rollups:
+            self.analytics_manager.save_rollups(args.rollups, merge=args.merge_rollups)
+        if args.build_also_likes:
+            self.analytics_manager.build_also_likes_table(args.top_k, args.min_readers, args.workers)
+        if args.sketches:
+            self.analytics_manager.sketch_analyzer.print_summary(args.doc_uuid)
+        if not args.task_id:
+            return
         
         try:
             if args.task_id == '2a':
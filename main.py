@@ -8,8 +8,8 @@ from config import DEFAULT_DATA_FILE
 
 def main():
     if len(sys.argv) > 1:
-        # Command line mode
-        analytics = AnalyticsManager()
+        # Command line mode, the CLI ingests the file given with -f
+        analytics = AnalyticsManager(load=False)
         analytics.run_cli()
     else:
         # GUI mode
@@ -1,14 +1,43 @@
 class DocumentView:
-    """Represents a single document view event from the JSON data"""
-    
-    def __init__(self, json_data):
-        self.visitor_uuid = json_data.get('visitor_uuid', '')
-        self.doc_uuid = json_data.get('env_doc_id', '')
-        self.country = json_data.get('visitor_country', '')
-        self.continent = json_data.get('visitor_continent', '')
-        self.useragent = json_data.get('visitor_useragent', '')
-        self.readtime = json_data.get('event_readtime', 0)
-        self.timestamp = json_data.get('ts', '')
+    """Lightweight view over a single document view event (one row of an EventStore)"""
+    
+    __slots__ = ('store', 'row')
+    
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+    
+    def _decode(self, column):
+        code = int(self.store.columns[column][self.row])
+        return self.store.tables[column].values[code]
+    
+    @property
+    def visitor_uuid(self):
+        return self._decode('visitor')
+    
+    @property
+    def doc_uuid(self):
+        return self._decode('doc')
+    
+    @property
+    def country(self):
+        return self._decode('country')
+    
+    @property
+    def continent(self):
+        return self._decode('continent')
+    
+    @property
+    def useragent(self):
+        return self._decode('useragent')
+    
+    @property
+    def readtime(self):
+        return int(self.store.columns['readtime'][self.row])
+    
+    @property
+    def timestamp(self):
+        return int(self.store.columns['ts'][self.row])
         
     def __repr__(self):
         doc_short = self.doc_uuid[:8] if self.doc_uuid else 'None'
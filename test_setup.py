@@ -6,6 +6,91 @@ import os
 import sys
 
 
+def write_co_read_fixture(path, n_docs=40, n_visitors=600, seed=7):
+    """Write a synthetic JSON-lines file with real co-reads, return its records
+
+    Visitors read a few documents each, popular documents more often, so
+    also-likes rankings are non-trivial (and contain ties) while staying
+    small enough to check against plain Python.
+    """
+    import json
+    import random
+    rng = random.Random(seed)
+    docs = [f"{i:012d}-{rng.getrandbits(128):032x}" for i in range(n_docs)]
+    weights = [1 / (rank + 1) for rank in range(n_docs)]
+    countries = ['GB', 'US', 'DE', 'FR', 'MX', 'JP']
+    useragents = ['Mozilla/5.0 (Windows NT 10.0) Chrome/120.0 Safari/537.36',
+                  'Mozilla/5.0 (Macintosh) Version/17.0 Safari/605.1.15',
+                  'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0']
+    records = []
+    ts = 1393631989
+    for i in range(n_visitors):
+        visitor = f"{rng.getrandbits(64):016x}"
+        country, useragent = rng.choice(countries), rng.choice(useragents)
+        for doc in set(rng.choices(docs, weights, k=rng.randint(1, 6))):
+            for event_type in ('impression', 'read', 'pagereadtime'):
+                ts += rng.randint(0, 120)
+                record = {'ts': ts, 'visitor_uuid': visitor, 'visitor_country': country,
+                          'visitor_useragent': useragent, 'env_doc_id': doc, 'event_type': event_type}
+                if event_type == 'pagereadtime':
+                    record['event_readtime'] = rng.randint(1000, 60000)
+                records.append(record)
+    with open(path, 'w') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+    return records
+
+
+def expected_also_likes(records, doc_uuid, visitor_uuid=None, top_n=10):
+    """Task 5d computed directly from the records: most co-readers first, ties by UUID"""
+    readers = {}
+    for record in records:
+        if record['event_type'] in ('read', 'pageread', 'pagereadtime'):
+            readers.setdefault(record['env_doc_id'], set()).add(record['visitor_uuid'])
+    doc_readers = readers.get(doc_uuid, set()) - {visitor_uuid}
+    counts = {doc: len(visitors & doc_readers) for doc, visitors in readers.items() if doc != doc_uuid}
+    ranked = sorted((doc for doc, count in counts.items() if count), key=lambda doc: (-counts[doc], doc))
+    return ranked[:top_n]
+
+
+def legacy_browser_name(useragent):
+    """The if/else chain BrowserParser.extract_browser_name replaced, minus Facebook"""
+    if not useragent:
+        return 'Unknown'
+    useragent = useragent.lower()
+    for name, markers in [('Edge', ['edg/', 'edge/']),
+                          ('Chrome', ['chrome/', 'crios/', 'crmo/']),
+                          ('Safari', ['safari/']),
+                          ('Firefox', ['firefox/', 'fxios/']),
+                          ('Opera', ['opera/', 'opr/', 'opios/']),
+                          ('Internet Explorer', ['msie', 'trident/']),
+                          ('Mozilla', ['mozilla/']),
+                          ('Bot/Crawler', ['bot', 'crawler', 'spider', 'scraper'])]:
+        if any(marker in useragent for marker in markers):
+            return name
+    return 'Other'
+
+
+def useragent_corpus(n=20000, seed=11):
+    """Real user agents plus random splices of marker fragments, overlaps included"""
+    import random
+    rng = random.Random(seed)
+    fragments = ['edg/', 'edge/', 'msi', 'msie', 'chrome/', 'crios/', 'crmo/', 'safari/', 'firefox/',
+                 'fxios/', 'opera/', 'opr/', 'opios/', 'trident/', 'mozilla/', 'bot', 'crawler',
+                 'spider', 'scraper', 'Mozilla/5.0 ', 'Version/17.0 ', '(Windows NT 10.0) ', 'e', 'r',
+                 'o', '/', ' ', '1']
+    corpus = ['Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+              'Chrome/120.0 Safari/537.36 Edg/120.0',
+              'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 '
+              '(KHTML, like Gecko) CriOS/120.0 Mobile/15E148 Safari/604.1',
+              'Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 6.1; Trident/4.0)',
+              'Opera/9.80 (Windows NT 6.1) Presto/2.12.388 Version/12.16',
+              'Googlebot/2.1 (+http://www.google.com/bot.html)', 'msiedge/ Firefox/1', '', 'curl/8.0']
+    for _ in range(n):
+        corpus.append(''.join(rng.choice(fragments) for _ in range(rng.randint(1, 6))))
+    return corpus
+
+
 def test_imports():
     """Test 1: Check if all modules can be imported"""
     print("\n" + "="*80)
@@ -15,6 +100,7 @@ def test_imports():
     modules = [
         ("AnalyticsManager", "analytics_manager", "AnalyticsManager"),
         ("DataLoader", "data.data_loader", "DataLoader"),
+        ("EventStore", "data.event_store", "EventStore"),
         ("CountryMapper", "utils.country_mapper", "CountryMapper"),
         ("BrowserParser", "utils.browser_parser", "BrowserParser"),
         ("DocumentView", "models.document_view", "DocumentView"),
@@ -97,6 +183,341 @@ def test_data_loading():
         return False
 
 
+def test_streaming_loader():
+    """Test 2b: Check that streamed records match the loaded list"""
+    print("\n" + "="*80)
+    print("TEST 2b: Testing Streaming Data Loading")
+    print("="*80)
+    
+    try:
+        from data.data_loader import DataLoader
+        from analyzers.country_analyzer import CountryAnalyzer
+        
+        loader = DataLoader("data/issuu_sample.json", batch_size=2)
+        data = loader.load_data()
+        streamed = list(loader.iter_records())
+        
+        if streamed != data:
+            print(f"  ✗ Streamed {len(streamed)} records, loaded {len(data)}")
+            return False
+        print(f"  ✓ Streamed {len(streamed)} records lazily")
+        
+        batches = list(loader.iter_batches())
+        if [r for batch in batches for r in batch] != data:
+            print("  ✗ Batches do not add up to the loaded records")
+            return False
+        print(f"  ✓ Streamed {len(batches)} batches of at most 2 records")
+        
+        sample_doc = data[0].get('env_doc_id', '')
+        from_list = CountryAnalyzer(data).get_views_by_country(sample_doc)
+        from_stream = CountryAnalyzer(loader.iter_records()).get_views_by_country(sample_doc)
+        if from_list != from_stream:
+            print("  ✗ Analyzer results differ between list and stream input")
+            return False
+        print("  ✓ Analyzers accept a record stream")
+        
+        timestamps = sorted(int(record['ts']) for record in data)
+        window = (timestamps[1], timestamps[-1])
+        in_window = [record for record in data if window[0] <= int(record['ts']) < window[1]]
+        windowed = loader.load_store().window(*window)
+        if len(windowed) != len(in_window):
+            print(f"  ✗ Time window kept {len(windowed)} records, expected {len(in_window)}")
+            return False
+        print(f"  ✓ Time window [{window[0]}, {window[1]}) kept {len(windowed)} records")
+        
+        # A window over a store parsed without timestamps cannot be honoured
+        from analyzers.reader_analyzer import ReaderAnalyzer
+        untimed = DataLoader("data/issuu_sample.json", use_cache=False, columns=ReaderAnalyzer.COLUMNS)
+        try:
+            ReaderAnalyzer(untimed.load_store(), window=window)
+        except ValueError:
+            print("  ✓ A window over a store without timestamps is refused")
+        else:
+            print("  ✗ A window over a store without timestamps was ignored")
+            return False
+        
+        return True
+        
+    except Exception as e:
+        print(f"  ✗ Error testing streaming loader: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_parallel_loader():
+    """Test 2c: Check that the parallel parser matches the serial one"""
+    print("\n" + "="*80)
+    print("TEST 2c: Testing Parallel Data Loading")
+    print("="*80)
+    
+    try:
+        import numpy as np
+        from data.data_loader import DataLoader
+        
+        serial = DataLoader("data/issuu_sample.json", use_cache=False).load_store()
+        parallel = DataLoader("data/issuu_sample.json", use_cache=False, workers=2).load_store()
+        
+        if len(parallel) != len(serial):
+            print(f"  ✗ Parallel parser read {len(parallel)} records, serial {len(serial)}")
+            return False
+        print(f"  ✓ Parallel parser read {len(parallel)} records")
+        
+        for name, column in serial.columns.items():
+            if not np.array_equal(column, parallel.columns[name]):
+                print(f"  ✗ Column {name} differs from the serial parse")
+                return False
+        for name, table in serial.tables.items():
+            if table.values != parallel.tables[name].values:
+                print(f"  ✗ String table {name} differs from the serial parse")
+                return False
+        print("  ✓ Columns and string tables match the serial parse")
+        
+        return True
+        
+    except Exception as e:
+        print(f"  ✗ Error testing parallel loader: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_decoders():
+    """Test 2e: Check that every installed JSON backend parses the sample alike"""
+    print("\n" + "="*80)
+    print("TEST 2e: Testing JSON Decoder Backends")
+    print("="*80)
+    
+    try:
+        import numpy as np
+        from data.data_loader import DataLoader
+        from data.decoders import DECODERS
+        from data.event_store import EventStore
+        
+        reference = DataLoader("data/issuu_sample.json", use_cache=False, decoder='json').load_store()
+        for name, make_decoder in DECODERS.items():
+            try:
+                make_decoder()
+            except ImportError:
+                print(f"  ⚠ {name} is not installed, skipped")
+                continue
+            loader = DataLoader("data/issuu_sample.json", use_cache=False, decoder=name)
+            # Both the lazy full parse and the tail reader keep the previous
+            # record alive while the next line is decoded
+            for label, store in [("load_store", loader.load_store()),
+                                 ("iter_tail_chunks", EventStore.concat(list(loader.iter_tail_chunks(0))))]:
+                if len(store) != len(reference) or any(
+                        not np.array_equal(store.columns[column], reference.columns[column])
+                        for column in reference.columns):
+                    print(f"  ✗ {name} {label} read {len(store)} records differing from json's {len(reference)}")
+                    return False
+            print(f"  ✓ {name} parses all {len(reference)} records like json")
+        
+        return True
+        
+    except Exception as e:
+        print(f"  ✗ Error testing decoders: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_snapshot_cache():
+    """Test 2f: Check that binary snapshots are published safely and reload like a parse"""
+    print("\n" + "="*80)
+    print("TEST 2f: Testing Snapshot Cache")
+    print("="*80)
+    
+    try:
+        import json
+        import shutil
+        import tempfile
+        import numpy as np
+        from data.data_loader import DataLoader
+        from data.snapshot import SnapshotWriter, load_snapshot, FORMAT_VERSION
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.json")
+            shutil.copyfile("data/issuu_sample.json", path)
+            store = DataLoader(path, use_cache=False).load_store()
+            
+            # A second writer of the same contents finds the snapshot already
+            # published, as when two processes parse the file at once, and
+            # must neither delete it under its readers nor fail
+            published = []
+            for _ in range(2):
+                writer = SnapshotWriter(path, directory)
+                writer.append(store)
+                writer.commit(store.tables)
+                published.append(os.stat(os.path.join(directory, writer.name)).st_ino)
+            entries = sorted(os.listdir(directory))
+            if (entries != sorted(["events.json", writer.name]) or published[0] != published[1]
+                    or load_snapshot(path, directory) is None):
+                print(f"  ✗ Publishing the same snapshot twice replaced it or left {entries}")
+                return False
+            print("  ✓ Publishing a snapshot that already exists keeps it")
+            
+            snapshot = load_snapshot(path, directory)
+            if (len(snapshot) != len(store)
+                    or any(not np.array_equal(snapshot.columns[name], store.columns[name])
+                           for name in store.columns)
+                    or any(snapshot.tables[name].values != store.tables[name].values
+                           for name in store.tables)):
+                print("  ✗ The snapshot differs from a fresh parse")
+                return False
+            if not all(isinstance(column, np.memmap) for column in snapshot.columns.values()):
+                print("  ✗ Snapshot columns are not memory-mapped")
+                return False
+            print(f"  ✓ Snapshot of {len(snapshot)} records matches a fresh parse, columns memory-mapped")
+            
+            # Touching or growing the file gives it a new content key
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            if load_snapshot(path, directory) is not None:
+                print("  ✗ A snapshot was loaded after the file's mtime changed")
+                return False
+            writer = SnapshotWriter(path, directory)
+            writer.append(store)
+            writer.commit(store.tables)
+            with open(path, 'a') as file:
+                file.write('\n')
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            if load_snapshot(path, directory) is not None:
+                print("  ✗ A snapshot was loaded after the file's size changed")
+                return False
+            print("  ✓ Changing the file's mtime or size invalidates its snapshot")
+            
+            # Damaged snapshots are a cache miss, not an error
+            writer = SnapshotWriter(path, directory)
+            writer.append(store)
+            writer.commit(store.tables)
+            with open(os.path.join(directory, writer.name, 'meta.json'), 'w') as file:
+                file.write('{"version": ')
+            corrupt = load_snapshot(path, directory)
+            os.remove(os.path.join(directory, writer.name, 'meta.json'))
+            os.remove(os.path.join(directory, writer.name, 'tables.json'))
+            with open(os.path.join(directory, writer.name, 'meta.json'), 'w') as file:
+                json.dump({'version': FORMAT_VERSION, 'rows': len(store)}, file)
+            if corrupt is not None or load_snapshot(path, directory) is not None:
+                print("  ✗ A corrupt or incomplete snapshot was loaded")
+                return False
+            print("  ✓ Corrupt or incomplete snapshots are ignored")
+        
+        return True
+        
+    except Exception as e:
+        print(f"  ✗ Error testing snapshot cache: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_incremental_ingest():
+    """Test 2d: Check that resuming from saved state matches a full ingest"""
+    print("\n" + "="*80)
+    print("TEST 2d: Testing Incremental Ingest")
+    print("="*80)
+    
+    try:
+        import tempfile
+        from analytics_manager import AnalyticsManager
+        
+        with open("data/issuu_sample.json", 'rb') as file:
+            data = file.read()
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.json")
+            # Cut in the middle of a line, as a writer still appending would
+            with open(path, 'wb') as file:
+                file.write(data[:len(data) // 2])
+            first = AnalyticsManager(path, load=False)
+            first.data_loader.cache_dir = directory
+            first.ingest(incremental=True)
+            
+            with open(path, 'wb') as file:
+                file.write(data)
+            resumed = AnalyticsManager(path, load=False)
+            resumed.data_loader.cache_dir = directory
+            resumed.ingest(incremental=True)
+            
+            full = AnalyticsManager(path, load=False)
+            full.data_loader.use_cache = False
+            full.ingest()
+        
+        if resumed.data_loader.offset != len(data):
+            print(f"  ✗ Resumed at byte {resumed.data_loader.offset}, expected {len(data)}")
+            return False
+        print(f"  ✓ Second run consumed only the tail, up to byte {resumed.data_loader.offset}")
+        
+        if resumed.reader_analyzer.get_top_readers(20) != full.reader_analyzer.get_top_readers(20):
+            print("  ✗ Top readers differ from a full ingest")
+            return False
+        if resumed.browser_analyzer.get_browser_counts() != full.browser_analyzer.get_browser_counts():
+            print("  ✗ Browser counts differ from a full ingest")
+            return False
+        print("  ✓ Resumed state matches a full ingest")
+        
+        # Follow mode: each snapshot drives the next change to the file, an
+        # append and then a rewrite to something shorter
+        import json
+        from analyzers.browser_analyzer import BrowserAnalyzer
+        from analyzers.country_analyzer import CountryAnalyzer
+        from analyzers.reader_analyzer import ReaderAnalyzer
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.json")
+            records = write_co_read_fixture(path, n_visitors=200)
+            doc = records[0]['env_doc_id']
+            stages = [records[:len(records) // 2], records, records[:len(records) // 4]]
+            
+            def write(stage, mode):
+                with open(path, mode) as file:
+                    for record in stage:
+                        file.write(json.dumps(record) + '\n')
+            
+            write(stages[0], 'w')
+            seen = []
+            
+            def on_snapshot(snapshot):
+                seen.append(snapshot)
+                if len(seen) == 1:
+                    write(stages[1][len(stages[0]):], 'a')
+                elif len(seen) == 2:
+                    write(stages[2], 'w')
+            
+            follower = AnalyticsManager(path, load=False)
+            follower.data_loader.cache_dir = directory
+            follower.print_live_snapshot = on_snapshot
+            export_path = os.path.join(directory, "live.json")
+            follower.follow(interval=0, poll_interval=0, doc_uuid=doc, top_n=5,
+                            export_path=export_path, max_snapshots=len(stages))
+            with open(export_path, 'r', encoding='utf-8') as file:
+                exported = json.load(file)
+        
+        if len(seen) != len(stages):
+            print(f"  ✗ follow took {len(seen)} snapshots, expected {len(stages)}")
+            return False
+        for label, snapshot, stage in zip(("initial", "appended", "truncated"), seen, stages):
+            expected = {'top_readers': ReaderAnalyzer(stage).get_top_readers(5),
+                        'browsers': BrowserAnalyzer(stage).get_browser_counts(),
+                        'countries': CountryAnalyzer(stage).get_views_by_country(doc)}
+            if {key: snapshot[key] for key in expected} != expected:
+                print(f"  ✗ Live snapshot of the {label} file differs from a fresh analysis")
+                return False
+        if exported != json.loads(json.dumps(seen[-1])):
+            print("  ✗ The exported JSON is not the last live snapshot")
+            return False
+        print("  ✓ follow tracks appends and restarts after truncation")
+        
+        return True
+        
+    except Exception as e:
+        print(f"  ✗ Error testing incremental ingest: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
 def test_country_analyzer():
     """Test 3: Test CountryAnalyzer (Task 2a, 2b)"""
     print("\n" + "="*80)
@@ -147,6 +568,13 @@ def test_country_analyzer():
             print("  ✗ Task 2b: No continent data found")
             return False
         
+        # Batch histograms must agree with the single document queries
+        histograms = analyzer.get_country_histograms([sample_doc])
+        if histograms.get(sample_doc) != country_counts:
+            print("  ✗ Batch country histograms differ from Task 2a")
+            return False
+        print(f"  ✓ Batch histograms match, top countries overall: {analyzer.get_top_countries(3)}")
+        
         print("  ✓ CountryAnalyzer working correctly")
         return True
         
@@ -196,6 +624,51 @@ def test_browser_analyzer():
             print("  ✗ Task 3b: No simplified browser data found")
             return False
         
+        # The table-driven parser must agree with the if/else chain it replaced,
+        # apart from the Facebook rule it added
+        from utils.browser_parser import BrowserParser
+        corpus = [ua for ua in useragent_corpus() + [record.get('visitor_useragent') for record in data]
+                  if not any(marker in (ua or '').lower() for marker in ('fban/', 'fbav/'))]
+        mismatches = [ua for ua in corpus if BrowserParser.extract_browser_name(ua) != legacy_browser_name(ua)]
+        if mismatches:
+            print(f"  ✗ Parser differs from the old if/else on {len(mismatches)} user agents, "
+                  f"e.g. {mismatches[0]!r}")
+            return False
+        print(f"  ✓ Parser matches the old if/else on {len(corpus)} user agents")
+        
+        # Facebook's in-app browser wins over the system browser it wraps
+        facebook = ['Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 '
+                    '(KHTML, like Gecko) Mobile/15E148 [FBAN/FBIOS;FBAV/440.0.0.35.106]',
+                    'Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 (KHTML, like Gecko) '
+                    'Chrome/120.0 Mobile Safari/537.36 [FB_IAB/FB4A;FBAV/445.0.0.34.118;]']
+        if [BrowserParser.extract_browser_name(ua) for ua in facebook] != ['Facebook', 'Facebook']:
+            print("  ✗ Facebook in-app browser user agents are not classified as Facebook")
+            return False
+        print("  ✓ Facebook in-app browser classified")
+        
+        # However often a user agent recurs, across chunks and queries, it is classified once
+        useragents = useragent_corpus(300, seed=2)
+        fresh = BrowserAnalyzer()
+        for _ in range(3):
+            fresh.consume([{'visitor_useragent': ua} for ua in useragents])
+            fresh.get_browser_counts()
+        stats = fresh.get_classification_stats()
+        distinct = {ua or '' for ua in useragents}
+        # The analyzer also classifies '' (a missing user agent) up front
+        if stats['misses'] != len(distinct | {''}) or stats['size'] != stats['misses']:
+            print(f"  ✗ {len(distinct)} distinct user agents caused {stats['misses']} classifier misses")
+            return False
+        distinct = len(distinct)
+        parser = BrowserParser()
+        for ua in useragents * 2:
+            parser.classify(ua)
+        stats = parser.cache_stats()
+        if (stats['misses'], stats['hits']) != (distinct, 2 * len(useragents) - distinct):
+            print(f"  ✗ Classifier cache counted {stats['misses']} misses and {stats['hits']} hits")
+            return False
+        print(f"  ✓ {distinct} distinct user agents classified once each, "
+              f"hit rate {stats['hit_rate']:.0%} on repeats")
+        
         print("  ✓ BrowserAnalyzer working correctly")
         return True
         
@@ -241,6 +714,26 @@ def test_reader_analyzer():
             print("  ✗ Task 4: No reader data found")
             return False
         
+        # Equal totals rank by visitor UUID, whatever order the events came in
+        import random
+        rng = random.Random(5)
+        totals = {f"{rng.getrandbits(64):016x}": rng.choice([60, 120, 180]) for _ in range(40)}
+        records = [{'visitor_uuid': visitor, 'event_type': 'pagereadtime', 'event_readtime': part}
+                   for visitor, total in totals.items() for part in (total // 3, total - total // 3)]
+        records += [{'visitor_uuid': 'no-readtime', 'event_type': 'read'}]
+        expected = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+        for _ in range(3):
+            rng.shuffle(records)
+            fixture = ReaderAnalyzer(records)
+            if fixture.get_top_readers(12) != expected[:12]:
+                print("  ✗ Readers with equal totals are not ranked by UUID")
+                return False
+            # More readers asked for than there are: every reader, none invented
+            if fixture.get_top_readers(100) != expected:
+                print("  ✗ Asking for more readers than exist did not return exactly every reader")
+                return False
+        print(f"  ✓ Ties ranked by UUID in any event order, n past {len(totals)} readers returns them all")
+        
         print("  ✓ ReaderAnalyzer working correctly")
         return True
         
@@ -298,13 +791,51 @@ def test_recommendation_analyzer():
             print(f"  ✓ Task 5b: Found {len(docs)} documents for visitor")
         else:
             print("  ⚠ Task 5b: No documents found (might be normal for small data)")
+
+        # Test Task 5d on a fixture with real co-reads (the sample has none)
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "co_reads.json")
+            records = write_co_read_fixture(path)
+            fixture = RecommendationAnalyzer(DataLoader(path, use_cache=False))
+        doc_uuids = sorted({record['env_doc_id'] for record in records})
+        readers = sorted({record['visitor_uuid'] for record in records
+                          if record['env_doc_id'] == doc_uuids[0]})
+        queries = [(doc_uuid, visitor_uuid) for doc_uuid in doc_uuids for visitor_uuid in (None, readers[0])]
+        for doc_uuid, visitor_uuid in queries:
+            if fixture.get_top_also_likes(doc_uuid, visitor_uuid) != expected_also_likes(records, doc_uuid, visitor_uuid):
+                print(f"  ✗ Task 5d: Wrong also-likes for {doc_uuid[:16]}... excluding {visitor_uuid}")
+                return False
+        also_likes = fixture.get_top_also_likes(doc_uuids[0], readers[0], top_n=5)
+        if len(also_likes) != 5:
+            print(f"  ✗ Task 5d: Expected 5 also-liked documents on the fixture, got {len(also_likes)}")
+            return False
+        print(f"  ✓ Task 5d: {len(queries)} fixture queries match a direct computation")
         
-        # Test Task 5d: get_top_also_likes
-        try:
-            also_likes = analyzer.get_top_also_likes(sample_doc, sample_visitor, top_n=5)
-            print(f"  ✓ Task 5d: Found {len(also_likes)} also-liked documents")
-        except Exception as e:
-            print(f"  ⚠ Task 5d: Could not get also-likes (might be normal for small data): {e}")
+        batch = fixture.get_top_also_likes_batch(doc_uuids, readers[0], top_n=5)
+        if any(batch[doc_uuid] != expected_also_likes(records, doc_uuid, readers[0], 5) for doc_uuid in doc_uuids):
+            print("  ✗ Task 5d: Batch also-likes differ from the single queries")
+            return False
+        print("  ✓ Task 5d: Batch also-likes match the single queries")
+        hits = fixture.get_cache_stats()['hits']
+        if fixture.get_top_also_likes(doc_uuids[0], readers[0], top_n=5) != also_likes \
+                or fixture.get_cache_stats()['hits'] != hits + 1:
+            print("  ✗ Task 5d: Repeated query was not served from the cache")
+            return False
+        print(f"  ✓ Task 5d: Repeated query served from the cache ({fixture.get_cache_stats()})")
+        
+        # A small reader sample and rerank budget make the approximate path
+        # actually drop candidates on the fixture
+        fixture.enable_approximate(min_readers=1, sample_size=32, rerank=20)
+        report = fixture.benchmark_approximate(top_n=10, sample=20)
+        approximate = fixture.get_top_also_likes(doc_uuids[0])
+        fixture.disable_approximate()
+        if not report['mean_candidates'] or not approximate or report['recall@10'] < 0.9:
+            print(f"  ✗ Task 5d: Approximate also-likes recall@10 {report['recall@10']:.2f} "
+                  f"with {report['mean_candidates']:.0f} candidates, expected at least 0.90")
+            return False
+        print(f"  ✓ Task 5d: Approximate also-likes recall@10 {report['recall@10']:.2f} "
+              f"from {report['mean_candidates']:.0f} candidates")
         
         print("  ✓ RecommendationAnalyzer working correctly")
         return True
@@ -316,6 +847,89 @@ def test_recommendation_analyzer():
         return False
 
 
+def test_sketch_analyzer():
+    """Test 6b: Check sketch accuracy and that partition sketches merge into the whole"""
+    print("\n" + "="*80)
+    print("TEST 6b: Testing SketchAnalyzer (Approximate Counts)")
+    print("="*80)
+    
+    try:
+        import random
+        import tempfile
+        import numpy as np
+        from data.data_loader import DataLoader
+        from analyzers.sketch_analyzer import SketchAnalyzer
+        
+        # Distinct readers of a document far beyond the linear-counting range
+        rng = random.Random(3)
+        sizes = {'popular-doc': 20000, 'niche-doc': 300}
+        records = [{'env_doc_id': doc, 'visitor_uuid': f"{rng.getrandbits(64):016x}",
+                    'visitor_country': 'GB', 'event_type': 'read', 'ts': 0}
+                   for doc, size in sizes.items() for _ in range(size)]
+        # Repeat reads must not count twice
+        records += records[:5000]
+        rng.shuffle(records)
+        sketches = SketchAnalyzer(records)
+        for doc, size in sizes.items():
+            estimate = sketches.get_unique_readers(doc)
+            # 3 standard errors of a precision-10 HyperLogLog
+            if abs(estimate - size) > 0.1 * size:
+                print(f"  ✗ {doc}: estimated {estimate} distinct readers, expected {size}")
+                return False
+            print(f"  ✓ {doc}: estimated {estimate} distinct readers of {size}")
+        # Documents with a few readers stay in the sparse form (register
+        # collisions aside, linear counting is exact for them)
+        few = [{'env_doc_id': f"doc-{i}", 'visitor_uuid': f"{rng.getrandbits(64):016x}",
+                'visitor_country': 'GB', 'event_type': 'read', 'ts': 0}
+               for i in range(2000) for _ in range(i % 7 + 1)]
+        niche = SketchAnalyzer(few).document_readers
+        dense_bytes = len(niche) * (1 << niche.precision)
+        counts = niche.counts()
+        if (any(abs(counts[f"doc-{i}"] - (i % 7 + 1)) > 1 for i in range(2000))
+                or niche.nbytes() * 10 > dense_bytes):
+            print(f"  ✗ Sparse HyperLogLog keys took {niche.nbytes():,} bytes or miscounted")
+            return False
+        print(f"  ✓ {len(niche)} sparse keys counted in {niche.nbytes():,} bytes "
+              f"({dense_bytes:,} as dense registers)")
+        
+        reads = sum(record['env_doc_id'] == 'popular-doc' for record in records)
+        estimate = sketches.get_document_reads('popular-doc')
+        if not reads <= estimate <= reads + 2 * len(records) / sketches.document_reads.width:
+            print(f"  ✗ Count-Min estimated {estimate} reads, expected {reads}")
+            return False
+        print(f"  ✓ Count-Min estimated {estimate} reads of {reads}")
+        
+        # Sketches of two halves of a stream, merged, equal the sketch of the whole
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "co_reads.json")
+            write_co_read_fixture(path)
+            whole = SketchAnalyzer(DataLoader(path, use_cache=False).iter_chunks(), top_k=10)
+            store = DataLoader(path, use_cache=False).load_store()
+        half = len(store) // 2
+        merged = SketchAnalyzer(store.take(np.arange(half)), top_k=10)
+        merged.merge(SketchAnalyzer(store.take(np.arange(half, len(store))), top_k=10))
+        # Merging an empty sketch changes nothing
+        merged.merge(SketchAnalyzer(top_k=10))
+        doc_uuids = store.tables['doc'].values[1:]
+        if ([merged.get_unique_readers(doc) for doc in doc_uuids] != [whole.get_unique_readers(doc) for doc in doc_uuids]
+                or merged.get_unique_visitors_by_country() != whole.get_unique_visitors_by_country()
+                or [merged.get_document_reads(doc) for doc in doc_uuids] != [whole.get_document_reads(doc) for doc in doc_uuids]):
+            print("  ✗ Merged partition sketches differ from the sketch of the whole stream")
+            return False
+        if [doc for doc, _ in merged.get_top_documents(3)] != [doc for doc, _ in whole.get_top_documents(3)]:
+            print("  ✗ Merged top documents differ from the whole stream's")
+            return False
+        print(f"  ✓ Merged partition sketches equal the sketch of the whole stream ({merged.nbytes():,} bytes)")
+        
+        return True
+        
+    except Exception as e:
+        print(f"  ✗ Error testing SketchAnalyzer: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
 def test_graph_visualizer():
     """Test 7: Test GraphVisualizer (Task 6)"""
     print("\n" + "="*80)
@@ -385,12 +999,86 @@ def test_analytics_manager():
         if len(data) > 0:
             sample_doc = data[0].get('env_doc_id', '')
             if sample_doc:
-                try:
-                    also_likes = manager.get_also_likes(sample_doc)
-                    print(f"  ✓ Also likes integration working")
-                except Exception as e:
-                    print(f"  ⚠ Also likes: {e}")
+                also_likes = manager.get_also_likes(sample_doc)
+                print(f"  ✓ Also likes integration working")
+        
+        # The precomputed table must answer like the live analyzer, also when
+        # the excluded visitor read the document (where lookup may fall back)
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "co_reads.json")
+            records = write_co_read_fixture(path)
+            fixture = AnalyticsManager(path, load=False)
+            fixture.data_loader.use_cache = False
+            fixture.ingest(tasks=['5d'])
+        readers = {}
+        for record in records:
+            if record['event_type'] == 'read':
+                readers.setdefault(record['env_doc_id'], set()).add(record['visitor_uuid'])
+        non_reader = next(visitor for visitor in sorted({record['visitor_uuid'] for record in records})
+                          if visitor not in readers[max(readers, key=lambda doc: len(readers[doc]))])
+        queries = [(doc_uuid, visitor_uuid, top_n) for doc_uuid in sorted(readers)
+                   for visitor_uuid in (None, min(readers[doc_uuid]), non_reader) for top_n in (3, 10)]
+        live = [fixture.get_also_likes(*query) for query in queries]
+        table = fixture.build_also_likes_table(top_k=10)
+        answered = fallbacks = 0
+        for (doc_uuid, visitor_uuid, top_n), expected in zip(queries, live):
+            if fixture.get_also_likes(doc_uuid, visitor_uuid, top_n) != expected:
+                print(f"  ✗ Precomputed also-likes of {doc_uuid[:16]}... excluding {visitor_uuid} differ")
+                return False
+            visitor_documents = None
+            if visitor_uuid is not None:
+                visitor_documents = fixture.recommendation_analyzer.get_documents_of_visitor(visitor_uuid).codes
+            if table.lookup(doc_uuid, top_n, visitor_documents) is None:
+                fallbacks += 1
+            else:
+                answered += 1
+        if not any(live) or not answered or not fallbacks:
+            print(f"  ✗ Fixture did not exercise the table ({answered} answered, {fallbacks} fell back)")
+            return False
+        print(f"  ✓ Precomputed table matches the live computation on {len(queries)} queries "
+              f"({answered} answered from the table, {fallbacks} fell back)")
+
+        # Files without read events, or missing ones, give an empty table
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("empty.json", "missing.json"):
+                path = os.path.join(directory, name)
+                if name == "empty.json":
+                    open(path, 'w').close()
+                empty = AnalyticsManager(path, load=False)
+                empty.data_loader.cache_dir = directory
+                empty.ingest(tasks=['5d'])
+                if len(empty.build_also_likes_table(workers=2)) != 0:
+                    print(f"  ✗ Also-likes table of {name} is not empty")
+                    return False
+        print("  ✓ Empty and missing files build an empty also-likes table")
+
+        # Rollup cubes summed over every bucket match the analyzers
+        import tempfile
+        from analyzers.rollup_analyzer import RollupAnalyzer
+        manager.data_loader.use_cache = False
+        manager.ingest(rollups=True)
+        with tempfile.TemporaryDirectory() as directory:
+            manager.save_rollups(directory)
+            rollups = RollupAnalyzer.load(directory)
+        sample_doc = data[0].get('env_doc_id', '')
+        if (rollups.get_views_by_country(sample_doc) != manager.country_analyzer.get_views_by_country(sample_doc)
+                or rollups.get_browser_counts() != manager.browser_analyzer.get_browser_counts()):
+            print("  ✗ Rollup cubes differ from the analyzers")
+            return False
+        print("  ✓ Saved rollup cubes match the analyzers")
         
+        # Sketches alone (no task), as `--sketches` runs them
+        from analyzers.sketch_analyzer import SketchAnalyzer
+        manager.ingest(tasks=[], sketches=True)
+        direct = SketchAnalyzer(manager.data_loader.load_store())
+        if (manager.sketch_analyzer.get_unique_readers(sample_doc) != direct.get_unique_readers(sample_doc)
+                or manager.sketch_analyzer.get_top_documents() != direct.get_top_documents()
+                or manager.sketch_analyzer.get_top_useragents() != direct.get_top_useragents()):
+            print("  ✗ The manager's sketches differ from a SketchAnalyzer of the file")
+            return False
+        print("  ✓ Sketches built by the manager match a SketchAnalyzer of the file")
+
         print("  ✓ AnalyticsManager integration working")
         return True
         
@@ -442,10 +1130,16 @@ def run_all_tests():
     tests = [
         ("Imports", test_imports),
         ("Data Loading", test_data_loading),
+        ("Streaming Loader", test_streaming_loader),
+        ("Parallel Loader", test_parallel_loader),
+        ("Decoder Backends", test_decoders),
+        ("Snapshot Cache", test_snapshot_cache),
+        ("Incremental Ingest", test_incremental_ingest),
         ("CountryAnalyzer (Task 2)", test_country_analyzer),
         ("BrowserAnalyzer (Task 3)", test_browser_analyzer),
         ("ReaderAnalyzer (Task 4)", test_reader_analyzer),
         ("RecommendationAnalyzer (Task 5)", test_recommendation_analyzer),
+        ("SketchAnalyzer", test_sketch_analyzer),
         ("GraphVisualizer (Task 6)", test_graph_visualizer),
         ("AnalyticsManager (Integration)", test_analytics_manager),
         ("GUI & CLI (Tasks 7 & 8)", test_gui_cli_interfaces),
@@ -482,7 +1176,9 @@ def run_all_tests():
             print(f"  {status}: {test_name}")
     
     print("\nIntegration & Setup:")
-    other_tests = ["Imports", "Data Loading", "AnalyticsManager (Integration)"]
+    other_tests = ["Imports", "Data Loading", "Streaming Loader", "Parallel Loader",
+                   "Decoder Backends", "Snapshot Cache", "Incremental Ingest", "SketchAnalyzer",
+                   "AnalyticsManager (Integration)"]
     for test_name, result in results:
         if test_name in other_tests:
             status = "✓ PASS" if result else "✗ FAIL"
@@ -1,43 +1,82 @@
+import re
+from functools import lru_cache
+
+# Browser families in order of precedence, with the lowercase user agent
+# markers that identify them. Most specific first to avoid misclassification:
+# Edge user agents also contain "Chrome/", Chrome ones also contain "Safari/",
+# and the generic Mozilla token is in nearly all of them. Facebook's in-app
+# browser (FBAN/FBIOS, FBAV) wraps the system webview, so it goes first.
+BROWSER_RULES = [
+    ('Facebook', ['fban/', 'fbav/']),
+    ('Edge', ['edg/', 'edge/']),
+    ('Chrome', ['chrome/', 'crios/', 'crmo/']),
+    ('Safari', ['safari/']),
+    ('Firefox', ['firefox/', 'fxios/']),
+    ('Opera', ['opera/', 'opr/', 'opios/']),
+    ('Internet Explorer', ['msie', 'trident/']),
+    ('Mozilla', ['mozilla/']),
+    ('Bot/Crawler', ['bot', 'crawler', 'spider', 'scraper']),
+]
+
+
+def compile_rules(rules):
+    """Compile a rule table into one regex over all markers and each marker's precedence"""
+    marker_ranks = {}
+    for rank, (_, markers) in enumerate(rules):
+        for marker in markers:
+            marker_ranks.setdefault(marker, rank)
+    # Longest first so no marker is shadowed by a shorter one at the same position
+    alternation = '|'.join(re.escape(marker)
+                           for marker in sorted(marker_ranks, key=len, reverse=True))
+    # A zero-width lookahead tries every position, so a marker overlapping an
+    # earlier match (the 'edge/' in 'msiedge/') is still found
+    return re.compile(f'(?=({alternation}))'), marker_ranks
+
+
+_MARKER_PATTERN, _MARKER_RANKS = compile_rules(BROWSER_RULES)
+
+
 class BrowserParser:
     
+    def __init__(self, cache_size=10000):
+        # Real traffic has a few thousand distinct user agents spread over
+        # millions of events, so each distinct string is classified once
+        self.cache_size = cache_size
+        self._classify = lru_cache(maxsize=cache_size)(self.extract_browser_name)
+    
+    def __getstate__(self):
+        # The memo is rebuilt on load rather than pickled with analyzer state
+        return {'cache_size': self.cache_size}
+    
+    def __setstate__(self, state):
+        self.__init__(state['cache_size'])
+    
+    def classify(self, useragent):
+        """Memoized extract_browser_name, keyed on the raw user agent string"""
+        return self._classify(useragent or '')
+    
+    def cache_stats(self):
+        """Hit/miss counters and size of the classification cache"""
+        info = self._classify.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'max_size': info.maxsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0,
+        }
+    
+    def clear_cache(self):
+        self._classify.cache_clear()
+    
     @staticmethod
     def extract_browser_name(useragent):
         if not useragent:
             return 'Unknown'
         
-        useragent_lower = useragent.lower()
-        
-        # Check in order (most specific first to avoid misclassification)
-        # Edge must be checked before Chrome (Edge contains "Chrome")
-        if 'edg/' in useragent_lower or 'edge/' in useragent_lower:
-            return 'Edge'
-        # Chrome must be checked before Safari (Chrome contains "Safari")
-        else:
-            if 'chrome/' in useragent_lower or 'crios/' in useragent_lower or 'crmo/' in useragent_lower:
-                return 'Chrome'
-            # Safari (after Chrome check)
-            else:
-                if 'safari/' in useragent_lower:
-                    return 'Safari'
-                # Firefox
-                else:
-                    if 'firefox/' in useragent_lower or 'fxios/' in useragent_lower:
-                        return 'Firefox'
-                    # Opera
-                    else:
-                        if 'opera/' in useragent_lower or 'opr/' in useragent_lower or 'opios/' in useragent_lower:
-                            return 'Opera'
-                        # Internet Explorer
-                        else:
-                            if 'msie' in useragent_lower or 'trident/' in useragent_lower:
-                                return 'Internet Explorer'
-                            # Mozilla (generic, after specific checks)
-                            else:
-                                if 'mozilla/' in useragent_lower:
-                                    return 'Mozilla'
-                                # Bots/Crawlers
-                                else:
-                                    if any(bot in useragent_lower for bot in ['bot', 'crawler', 'spider', 'scraper']):
-                                        return 'Bot/Crawler'
-                                    else:
-                                        return 'Other'
\ No newline at end of file
+        # A single scan finds every family marker, the highest precedence one wins
+        markers = _MARKER_PATTERN.findall(useragent.lower())
+        if not markers:
+            return 'Other'
+        return BROWSER_RULES[min(map(_MARKER_RANKS.__getitem__, markers))][0]
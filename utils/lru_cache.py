@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded least-recently-used cache whose entries also expire after `ttl` seconds
+
+    A ttl of None keeps entries until they are evicted or the cache is cleared.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, self._MISSING, count=False) is not self._MISSING
+
+    def get(self, key, default=None, count=True):
+        """Cached value of key (marking it recently used), default if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires = entry
+            if expires is None or time.monotonic() < expires:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            del self._entries[key]
+            self.expirations += 1
+        if count:
+            self.misses += 1
+        return default
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Cached value of key, computing and storing it on a miss"""
+        value = self.get(key, self._MISSING)
+        if value is self._MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """Drop every entry (the counters are kept)"""
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def __getstate__(self):
+        # Expiry times are monotonic clock readings, meaningless in another
+        # process, so the entries are not pickled
+        state = self.__dict__.copy()
+        state['_entries'] = OrderedDict()
+        return state
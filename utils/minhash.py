@@ -0,0 +1,81 @@
+import numpy as np
+
+# Multiplier used to fold the rows of one band into a single 64-bit key
+_BAND_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+class MinHashLSH:
+    """MinHash signatures of the rows of a CSR set matrix, indexed with banded LSH
+
+    Each row (e.g. the set of readers of a document) gets `num_perm` min
+    hashes; rows whose signatures agree on every hash of at least one of
+    the `bands` bands are candidates of each other. More bands of fewer
+    rows find more (and less similar) candidates, trading latency for
+    recall.
+    """
+
+    def __init__(self, num_perm=64, bands=16, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: odd 64-bit multipliers, upper 32 bits kept
+        self._a = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.position = np.zeros(0, dtype=np.int64)
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self.band_keys = np.zeros((bands, 0), dtype=np.uint64)
+        self._band_order = np.zeros((bands, 0), dtype=np.int64)
+        self._sorted_keys = np.zeros((bands, 0), dtype=np.uint64)
+
+    def build(self, indptr: np.ndarray, indices: np.ndarray):
+        """Signatures and band index of every non-empty row of a CSR matrix"""
+        lengths = np.diff(indptr)
+        self.rows = np.flatnonzero(lengths)
+        self.position = np.full(len(lengths), -1, dtype=np.int64)
+        self.position[self.rows] = np.arange(len(self.rows))
+        starts = indptr[:-1][self.rows]
+
+        values = indices.astype(np.uint64)
+        self.signatures = np.empty((len(self.rows), self.num_perm), dtype=np.uint32)
+        if len(self.rows):
+            # One pass over the entries per hash function keeps memory at O(nnz)
+            for i in range(self.num_perm):
+                hashes = self.hash_values(values, i)
+                self.signatures[:, i] = np.minimum.reduceat(hashes, starts)
+
+        per_band = self.num_perm // self.bands
+        self.band_keys = np.zeros((self.bands, len(self.rows)), dtype=np.uint64)
+        for band in range(self.bands):
+            keys = np.zeros(len(self.rows), dtype=np.uint64)
+            for column in range(band * per_band, (band + 1) * per_band):
+                keys = keys * _BAND_MULTIPLIER + self.signatures[:, column]
+            self.band_keys[band] = keys
+        self._band_order = np.argsort(self.band_keys, axis=1, kind='stable')
+        self._sorted_keys = np.take_along_axis(self.band_keys, self._band_order, axis=1)
+        return self
+
+    def candidates(self, row: int) -> np.ndarray:
+        """Rows sharing at least one band with `row` (sorted, without `row` itself)"""
+        if row is None or not 0 <= row < len(self.position) or self.position[row] < 0:
+            return np.zeros(0, dtype=np.int64)
+        position = self.position[row]
+        found = []
+        for band in range(self.bands):
+            key = self.band_keys[band, position]
+            start = np.searchsorted(self._sorted_keys[band], key, side='left')
+            end = np.searchsorted(self._sorted_keys[band], key, side='right')
+            found.append(self._band_order[band, start:end])
+        positions = np.unique(np.concatenate(found))
+        return self.rows[positions[positions != position]]
+
+    def hash_values(self, values: np.ndarray, function: int = 0) -> np.ndarray:
+        return (self._a[function] * values.astype(np.uint64) + self._b[function]) >> np.uint64(32)
+
+    def bottom_k(self, values: np.ndarray, k: int) -> np.ndarray:
+        """The k values with the smallest hash: a consistent uniform sample of a set"""
+        if len(values) <= k:
+            return values
+        return values[np.argpartition(self.hash_values(values), k)[:k]]
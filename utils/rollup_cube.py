@@ -0,0 +1,144 @@
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple
+import numpy as np
+
+from data.event_store import CodeMap, StringTable
+
+
+class RollupCube:
+    """Sparse cube of sums over a time bucket and a few categorical dimensions
+
+    Every cell is (bucket, dimension codes...) -> total. Dimension values are
+    encoded with the cube's own string tables, so cubes built from different
+    files or runs can be merged and persisted on their own. Added cells are
+    aggregated lazily, the first time the cube is read after an update.
+    """
+
+    def __init__(self, dimensions: Sequence[str], bucket_seconds: int):
+        self.dimensions = tuple(dimensions)
+        self.bucket_seconds = bucket_seconds
+        self.tables = {name: StringTable() for name in self.dimensions}
+        # Sorted unique cells: column 0 is the bucket, then one column per dimension
+        self.keys = np.zeros((0, len(self.dimensions) + 1), dtype=np.int64)
+        self.totals = np.zeros(0, dtype=np.int64)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        # Per dimension: codes of source table values in the cube's table
+        self._code_maps: Dict[str, CodeMap] = {}
+
+    def __len__(self):
+        self.compact()
+        return len(self.totals)
+
+    def _translate(self, name: str, codes: np.ndarray, source: StringTable) -> np.ndarray:
+        """Codes of a source table re-encoded into the cube's table for dimension name"""
+        # Created on first use, after load() replaced the tables
+        code_map = self._code_maps.get(name)
+        if code_map is None:
+            code_map = self._code_maps[name] = CodeMap(self.tables[name].encode_many)
+        return code_map(codes, source)
+
+    def add(self, ts: np.ndarray, codes: Dict[str, np.ndarray], sources: Dict[str, StringTable],
+            weights: np.ndarray = None):
+        """Add events (one, or `weights` each) given their timestamps and dimension codes
+
+        `codes` are encoded against the `sources` tables, e.g. an EventStore's.
+        """
+        if len(ts) == 0:
+            return
+        columns = [np.asarray(ts, dtype=np.int64) // self.bucket_seconds]
+        columns += [self._translate(name, codes[name], sources[name]) for name in self.dimensions]
+        weights = np.ones(len(ts), dtype=np.int64) if weights is None else weights.astype(np.int64)
+        self._pending.append(self._aggregate(np.column_stack(columns), weights))
+
+    @staticmethod
+    def _aggregate(keys: np.ndarray, totals: np.ndarray):
+        if len(totals) == 0:
+            return keys, totals
+        order = np.lexsort(keys.T[::-1])
+        keys, totals = keys[order], totals[order]
+        starts = np.concatenate([[0], np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1])
+        return keys[starts], np.add.reduceat(totals, starts)
+
+    def compact(self):
+        if not self._pending:
+            return
+        keys = np.concatenate([self.keys] + [keys for keys, _ in self._pending])
+        totals = np.concatenate([self.totals] + [totals for _, totals in self._pending])
+        self._pending = []
+        self.keys, self.totals = self._aggregate(keys, totals)
+
+    def merge(self, other: 'RollupCube'):
+        """Add every cell of another cube with the same dimensions and bucket size"""
+        if other.dimensions != self.dimensions or other.bucket_seconds != self.bucket_seconds:
+            raise ValueError("Cannot merge cubes with different dimensions or bucket sizes")
+        other.compact()
+        if not len(other.totals):
+            return
+        keys = other.keys.copy()
+        for i, name in enumerate(self.dimensions, 1):
+            mapping = np.array(self.tables[name].encode_many(other.tables[name].values), dtype=np.int64)
+            keys[:, i] = mapping[keys[:, i]]
+        self._pending.append((keys, other.totals.copy()))
+
+    def query(self, start: int = None, end: int = None, where: Dict[str, str] = None,
+              group_by: Iterable[str] = ()) -> Dict:
+        """Totals of the buckets starting in [start, end), grouped by some dimensions
+
+        `where` restricts dimensions to a value. Group keys are the decoded
+        values of the group_by dimensions ('bucket' groups by bucket start
+        time), or a single value when grouping by one dimension.
+        """
+        self.compact()
+        mask = np.ones(len(self.totals), dtype=bool)
+        buckets = self.keys[:, 0]
+        if start is not None:
+            mask &= buckets * self.bucket_seconds >= start
+        if end is not None:
+            mask &= buckets * self.bucket_seconds < end
+        for name, value in (where or {}).items():
+            code = self.tables[name].lookup(value) if value != '' else 0
+            if code is None:
+                return {}
+            mask &= self.keys[:, self.dimensions.index(name) + 1] == code
+
+        group_by = list(group_by)
+        columns = [0 if name == 'bucket' else self.dimensions.index(name) + 1 for name in group_by]
+        keys, totals = self.keys[mask][:, columns], self.totals[mask]
+        if not group_by:
+            return {(): int(totals.sum())}
+        keys, totals = self._aggregate(keys, totals)
+
+        decoded = []
+        for name, column in zip(group_by, keys.T.tolist()):
+            if name == 'bucket':
+                decoded.append([bucket * self.bucket_seconds for bucket in column])
+            else:
+                values = self.tables[name].values
+                decoded.append([values[code] for code in column])
+        groups = list(zip(*decoded)) if len(group_by) > 1 else decoded[0]
+        return dict(zip(groups, totals.tolist()))
+
+    def save(self, path: str):
+        self.compact()
+        arrays = {'keys': self.keys, 'totals': self.totals,
+                  'bucket_seconds': np.array(self.bucket_seconds),
+                  'dimensions': np.frombuffer('\n'.join(self.dimensions).encode('utf-8'), dtype=np.uint8)}
+        for name, table in self.tables.items():
+            # Code 0 is always the empty string, so it is not stored
+            names = '\n'.join(table.values[1:]).encode('utf-8')
+            arrays[f"table_{name}"] = np.frombuffer(names, dtype=np.uint8)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'RollupCube':
+        with np.load(path) as arrays:
+            dimensions = arrays['dimensions'].tobytes().decode('utf-8').split('\n')
+            cube = cls(dimensions, int(arrays['bucket_seconds']))
+            for name in cube.dimensions:
+                names = arrays[f"table_{name}"].tobytes().decode('utf-8')
+                cube.tables[name] = StringTable(names.split('\n') if names else [])
+            cube.keys = arrays['keys']
+            cube.totals = arrays['totals']
+        return cube
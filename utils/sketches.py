@@ -0,0 +1,298 @@
+import hashlib
+from typing import Dict, List, Tuple
+import numpy as np
+
+from data.event_store import CodeMap, StringTable, grow
+
+_SEED = 0x5EED
+
+
+def hash_strings(values) -> np.ndarray:
+    """64-bit hashes of strings, the same in every process (unlike hash())"""
+    return np.fromiter((int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(),
+                                       'little') for value in values),
+                       dtype=np.uint64, count=len(values))
+
+
+class TableHashes(CodeMap):
+    """Hashes of the values of string tables, computed once per distinct value
+
+    Sketches are updated from event store codes; hashing the decoded value
+    rather than the code keeps sketches of different files or processes,
+    whose tables assign different codes, mergeable.
+    """
+
+    def __init__(self):
+        super().__init__(hash_strings, np.uint64)
+
+
+def _leading_zeros(values: np.ndarray) -> np.ndarray:
+    """Leading zero bits of each uint64 (64 for zero), by binary search"""
+    values = values.copy()
+    zeros = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        small = values < np.uint64(1 << (64 - shift))
+        zeros[small] += shift
+        values[small] <<= np.uint64(shift)
+    zeros[values == 0] = 64
+    return zeros
+
+
+class KeyedHyperLogLog:
+    """One HyperLogLog distinct counter per key, e.g. distinct visitors per document
+
+    A key's 2**precision one-byte registers give a relative standard error
+    of about 1.04 / sqrt(2**precision) (3% at the default precision of 10).
+    Most keys (documents with a few readers) only ever set a few registers,
+    so keys start sparse: one int64 entry per set register, packing the key
+    code, the register and its rank. A key moves to a dense row of registers
+    once its entries would take more memory than the row. Both forms give
+    the same estimates, and sketches with the same precision merge by taking
+    the register-wise maximum.
+    """
+
+    # Bits of a sparse entry holding the rank (at most 64 - 4 + 1)
+    RANK_BITS = 6
+
+    def __init__(self, precision: int = 10):
+        if not 4 <= precision <= 16:
+            raise ValueError(f"precision must be between 4 and 16, got {precision}")
+        self.precision = precision
+        self.keys = StringTable()
+        # Sorted sparse entries (key << precision | register) << RANK_BITS | rank,
+        # one per set register of each sparse key
+        self.sparse = np.zeros(0, dtype=np.int64)
+        # Dense register rows; row 0 is unused so that 0 in dense_rows means sparse
+        self.registers = np.zeros((1, 1 << precision), dtype=np.uint8)
+        self.n_dense = 1
+        self.dense_rows = np.zeros(0, dtype=np.int64)
+        self._key_codes = CodeMap(self.keys.encode_many)
+
+    def __len__(self):
+        return len(self.keys) - 1
+
+    @property
+    def sparse_limit(self) -> int:
+        """Entries past which a key's dense row is smaller"""
+        return self.registers.shape[1] * self.registers.itemsize // self.sparse.itemsize
+
+    def add(self, key_codes: np.ndarray, source: StringTable, hashes: np.ndarray):
+        """Count the items with the given 64-bit hashes under keys encoded against source"""
+        if len(hashes) == 0:
+            return
+        keys = self._key_codes(key_codes, source)
+        register = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rank = np.minimum(_leading_zeros(hashes << np.uint64(self.precision)) + 1,
+                          64 - self.precision + 1).astype(np.int64)
+        self._update(keys, register, rank)
+
+    def _update(self, keys: np.ndarray, register: np.ndarray, rank: np.ndarray):
+        """Raise the registers of the given keys to at least the given ranks"""
+        self.dense_rows = grow(self.dense_rows, len(self.keys))
+        rows = self.dense_rows[keys]
+        dense = rows != 0
+        m = self.registers.shape[1]
+        np.maximum.at(self.registers.reshape(-1), rows[dense] * m + register[dense],
+                      rank[dense].astype(np.uint8))
+
+        sparse = ~dense
+        entries = np.sort((((keys[sparse] << self.precision) | register[sparse]) << self.RANK_BITS)
+                          | rank[sparse])
+        # Two sorted runs, which the stable sort merges in linear time
+        entries = np.concatenate([self.sparse, entries])
+        entries.sort(kind='stable')
+        # Entries of one register sort by rank, keep the last (highest) one
+        slots = entries >> self.RANK_BITS
+        last = np.ones(len(entries), dtype=bool)
+        last[:-1] = slots[1:] != slots[:-1]
+        self.sparse = entries[last]
+        self._promote()
+
+    def _promote(self):
+        """Move the keys with more sparse entries than sparse_limit to dense rows"""
+        entry_keys = self.sparse >> (self.RANK_BITS + self.precision)
+        full = np.flatnonzero(np.bincount(entry_keys, minlength=1) > self.sparse_limit)
+        if len(full) == 0:
+            return
+        self.dense_rows[full] = np.arange(self.n_dense, self.n_dense + len(full))
+        self.n_dense += len(full)
+        self.registers = grow(self.registers, self.n_dense)
+        moved = np.isin(entry_keys, full)
+        entries = self.sparse[moved]
+        register = (entries >> self.RANK_BITS) & (self.registers.shape[1] - 1)
+        self.registers[self.dense_rows[entry_keys[moved]], register] = entries & ((1 << self.RANK_BITS) - 1)
+        self.sparse = self.sparse[~moved]
+
+    def _estimate(self, inverse_sums: np.ndarray, empty: np.ndarray) -> np.ndarray:
+        """Estimates from the sums of 2**-register and the numbers of empty registers"""
+        m = self.registers.shape[1]
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / inverse_sums
+        # Linear counting is more accurate while many registers are still empty
+        small = (estimate <= 2.5 * m) & (empty > 0)
+        estimate[small] = m * np.log(m / empty[small])
+        return estimate
+
+    def _estimates(self, codes: np.ndarray) -> np.ndarray:
+        m = self.registers.shape[1]
+        self.dense_rows = grow(self.dense_rows, len(self.keys))
+        # Registers without a sparse entry are 0 and add 2**0 each
+        inverse_sums = np.full(len(codes), float(m))
+        empty = np.full(len(codes), m)
+        first = np.searchsorted(self.sparse, codes << (self.precision + self.RANK_BITS))
+        last = np.searchsorted(self.sparse, (codes + 1) << (self.precision + self.RANK_BITS))
+        lengths = last - first
+        positions = np.repeat(first - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        rank = self.sparse[positions] & ((1 << self.RANK_BITS) - 1)
+        entry_of = np.repeat(np.arange(len(codes)), lengths)
+        inverse_sums -= np.bincount(entry_of, 1 - np.ldexp(1.0, -rank), minlength=len(codes))
+        empty -= lengths
+
+        rows = self.dense_rows[codes]
+        dense = rows != 0
+        registers = self.registers[rows[dense]]
+        inverse_sums[dense] = np.sum(np.ldexp(1.0, -registers.astype(np.int64)), axis=1)
+        empty[dense] = np.count_nonzero(registers == 0, axis=1)
+        return self._estimate(inverse_sums, empty)
+
+    def count(self, key: str) -> int:
+        """Estimated number of distinct items counted under key"""
+        code = self.keys.lookup(key)
+        if code is None:
+            return 0
+        return int(round(self._estimates(np.array([code], dtype=np.int64))[0]))
+
+    def counts(self) -> Dict[str, int]:
+        """Estimated distinct items of every key"""
+        estimates = np.rint(self._estimates(np.arange(1, len(self.keys), dtype=np.int64))).astype(np.int64)
+        return dict(zip(self.keys.values[1:], estimates.tolist()))
+
+    def merge(self, other: 'KeyedHyperLogLog'):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precisions")
+        keys = np.array([0] + self.keys.encode_many(other.keys.values[1:]), dtype=np.int64)
+        entry_keys = other.sparse >> (other.RANK_BITS + other.precision)
+        register = (other.sparse >> other.RANK_BITS) & (other.registers.shape[1] - 1)
+        rank = other.sparse & ((1 << other.RANK_BITS) - 1)
+        # The set registers of other's dense keys, as entries
+        other_dense = np.flatnonzero(other.dense_rows)
+        rows, dense_register = np.nonzero(other.registers[other.dense_rows[other_dense]])
+        self._update(np.concatenate([keys[entry_keys], keys[other_dense[rows]]]),
+                     np.concatenate([register, dense_register]),
+                     np.concatenate([rank, other.registers[other.dense_rows[other_dense[rows]],
+                                                            dense_register].astype(np.int64)]))
+
+    def nbytes(self) -> int:
+        return self.sparse.nbytes + self.registers[:self.n_dense].nbytes + self.dense_rows.nbytes
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['registers'] = self.registers[:self.n_dense]
+        return state
+
+
+class CountMinSketch:
+    """Count-Min sketch of item frequencies in depth x width counters
+
+    Estimates never undercount; with total count N they overcount by at
+    most about 2N / width with probability 1 - 2**-depth. Sketches with
+    the same shape and seed merge by adding their counters.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4, seed: int = _SEED):
+        if width < 2 or width & (width - 1):
+            raise ValueError(f"width must be a power of two, got {width}")
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.total = 0
+        self.counters = np.zeros((depth, width), dtype=np.int64)
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing of the 64-bit item hashes, one function per row
+        self._a = rng.integers(0, 2**63, depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2**63, depth, dtype=np.uint64)
+        self._shift = np.uint64(64 - (width.bit_length() - 1))
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) >> self._shift).astype(np.int64)
+
+    def add(self, hashes: np.ndarray, weights: np.ndarray = None):
+        if len(hashes) == 0:
+            return
+        weights = np.ones(len(hashes), dtype=np.int64) if weights is None else weights.astype(np.int64)
+        columns = self._columns(hashes) + (np.arange(self.depth) * self.width)[:, None]
+        self.counters.reshape(-1)[:] += np.bincount(columns.reshape(-1), np.tile(weights, self.depth),
+                                                    minlength=self.counters.size).astype(np.int64)
+        self.total += int(weights.sum())
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        columns = self._columns(hashes)
+        return self.counters[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def count(self, value: str) -> int:
+        return int(self.estimate(hash_strings([value]))[0])
+
+    def merge(self, other: 'CountMinSketch'):
+        if (other.width, other.depth, other.seed) != (self.width, self.depth, self.seed):
+            raise ValueError("Cannot merge Count-Min sketches of different shapes or seeds")
+        self.counters += other.counters
+        self.total += other.total
+
+    def nbytes(self) -> int:
+        return self.counters.nbytes
+
+
+class SpaceSaving:
+    """Space-Saving summary of the (at most) `capacity` most frequent items
+
+    Counts are upper bounds, at most `error` above the true count; every
+    item more frequent than `floor` is guaranteed to be monitored. Batches
+    are summarised exactly and merged like any two summaries, so the
+    summary is mergeable across partitions.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        # item -> (count, error)
+        self.items: Dict[str, Tuple[int, int]] = {}
+        # Upper bound on the count of any item that is not monitored
+        self.floor = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def _truncate(self, items: Dict[str, Tuple[int, int]], floor: int):
+        if len(items) > self.capacity:
+            ranked = sorted(items.items(), key=lambda item: -item[1][0])
+            floor = max(floor, ranked[self.capacity][1][0])
+            items = dict(ranked[:self.capacity])
+        self.items, self.floor = items, floor
+
+    def add(self, codes: np.ndarray, source: StringTable, weights: np.ndarray = None):
+        """Count a batch of items encoded against source (code 0 is ignored)"""
+        counts = np.bincount(codes, weights, minlength=1)[1:]
+        seen = np.flatnonzero(counts)
+        batch_floor = 0
+        if len(seen) > self.capacity:
+            # Only the batch's own top items can enter the summary
+            order = np.argpartition(-counts[seen], self.capacity)
+            batch_floor = int(counts[seen[order[self.capacity:]]].max())
+            seen = seen[order[:self.capacity]]
+        batch = {source.values[code + 1]: (int(counts[code]), 0) for code in seen.tolist()}
+        self._merge_items(batch, batch_floor)
+
+    def _merge_items(self, other: Dict[str, Tuple[int, int]], other_floor: int):
+        merged = {}
+        for item in self.items.keys() | other.keys():
+            count, error = self.items.get(item, (self.floor, self.floor))
+            other_count, other_error = other.get(item, (other_floor, other_floor))
+            merged[item] = (count + other_count, error + other_error)
+        self._truncate(merged, self.floor + other_floor)
+
+    def merge(self, other: 'SpaceSaving'):
+        self._merge_items(other.items, other.floor)
+
+    def top(self, n: int = 10) -> List[Tuple[str, int]]:
+        """The n items with the highest counts, as (item, count) pairs"""
+        ranked = sorted(self.items.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(item, count) for item, (count, _) in ranked[:n]]
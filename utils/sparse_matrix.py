@@ -0,0 +1,136 @@
+from typing import List, Tuple
+import numpy as np
+
+# Pending batches are merged into one once there are this many
+MAX_PENDING = 32
+
+
+class SparseCountMatrix:
+    """Row-major (CSR) sparse matrix of counts, filled incrementally from (row, column) pairs
+
+    Rows and columns are integer codes, e.g. document and country codes of the
+    event store. Added pairs are pre-aggregated per batch and merged into the
+    CSR arrays lazily, the first time the matrix is read after an update, so
+    each row lookup is a slice of the arrays.
+
+    A binary matrix only records which pairs occur (an adjacency), so it
+    stores no counts: each pair costs the 4 bytes of its column code, and
+    data reads as a read-only array of ones.
+    """
+
+    def __init__(self, binary: bool = False):
+        self.binary = binary
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = self._ones(0) if binary else np.zeros(0, dtype=np.int64)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+
+    @staticmethod
+    def _ones(n: int) -> np.ndarray:
+        return np.broadcast_to(np.int64(1), (n,))
+
+    def add(self, rows: np.ndarray, columns: np.ndarray, counts: np.ndarray = None):
+        """Add one (or `counts`) to each (row, column) pair"""
+        if len(rows) == 0:
+            return
+        keys = (rows.astype(np.int64) << 32) | columns.astype(np.int64)
+        if self.binary:
+            self._pending.append((np.unique(keys), None))
+        else:
+            if counts is None:
+                keys, counts = np.unique(keys, return_counts=True)
+            self._pending.append((keys, counts.astype(np.int64)))
+        if len(self._pending) >= MAX_PENDING:
+            # Many small batches (e.g. follow mode) into a matrix nobody reads
+            # would otherwise pile up one array per batch
+            self._pending = [self._aggregate(self._pending)]
+            if len(self._pending[0][0]) >= len(self.indices):
+                self.compact()
+
+    def _aggregate(self, batches: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted unique keys of several batches and their summed counts (None if binary)"""
+        keys = np.concatenate([keys for keys, _ in batches])
+        if self.binary:
+            return np.unique(keys), None
+        counts = np.concatenate([counts for _, counts in batches])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        return keys, np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+
+    def _keys(self) -> np.ndarray:
+        rows = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        return (rows << 32) | self.indices.astype(np.int64)
+
+    def compact(self):
+        """Merge pending pairs into the CSR arrays"""
+        if not self._pending:
+            return
+        keys, counts = self._aggregate([(self._keys(), None if self.binary else self.data)] + self._pending)
+        self._pending = []
+        self._set_keys(keys)
+        self.data = self._ones(len(keys)) if self.binary else counts
+
+    def _set_keys(self, keys: np.ndarray):
+        """CSR structure of sorted unique (row << 32 | column) keys"""
+        rows = keys >> 32
+        n_rows = int(rows[-1]) + 1 if len(rows) else 0
+        self.indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=self.indptr[1:])
+        self.indices = (keys & 0xFFFFFFFF).astype(np.int32)
+
+    @property
+    def n_rows(self) -> int:
+        self.compact()
+        return len(self.indptr) - 1
+
+    def row(self, row: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Column codes and counts of one row (views into the CSR arrays)"""
+        self.compact()
+        if row is None or not 0 <= row < len(self.indptr) - 1:
+            return self.indices[:0], self.data[:0]
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def take_rows(self, rows) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """CSR arrays (indptr, indices, data) of the selected rows, in the given order
+
+        Unknown rows (None, negative or past the end) come back empty.
+        """
+        self.compact()
+        n_rows = len(self.indptr) - 1
+        if isinstance(rows, np.ndarray):
+            # Code arrays (CSR rows, candidate lists) cannot hold None
+            rows = rows.astype(np.int64, copy=False)
+        else:
+            rows = np.array([-1 if row is None else row for row in rows], dtype=np.int64)
+        valid = (rows >= 0) & (rows < n_rows)
+        safe_rows = np.where(valid, rows, 0)
+        starts = np.where(valid, self.indptr[safe_rows], 0)
+        lengths = np.where(valid, self.indptr[np.minimum(safe_rows + 1, n_rows)], 0) - starts
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        # Position of every selected entry in the full arrays, without a Python loop
+        positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return indptr, self.indices[positions], self.data[positions]
+
+    def column_totals(self) -> np.ndarray:
+        """Sum of every column over all rows, indexed by column code"""
+        self.compact()
+        return np.bincount(self.indices, weights=self.data).astype(np.int64)
+
+    def nbytes(self) -> int:
+        """Memory of the compacted arrays (the implicit ones of a binary matrix are free)"""
+        self.compact()
+        return self.indptr.nbytes + self.indices.nbytes + (0 if self.binary else self.data.nbytes)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.binary:
+            # A broadcast array would be pickled expanded
+            state['data'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.binary:
+            self.data = self._ones(len(self.indices))